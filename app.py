@@ -2,67 +2,152 @@ import streamlit as st
 import pandas as pd
 from datetime import date, datetime
 
+import os
+
 from dotenv import load_dotenv
 load_dotenv()
 
-from sheets_db import add_todo, list_todos, update_todo, delete_todo
+from todo_store import (
+    add_todo,
+    check_version,
+    data_version,
+    delete_todo,
+    invalidate_cache,
+    snapshot,
+    update_todo,
+    update_todos,
+)
+from todo_view import (
+    PRIORITY_CHOICES,
+    SHOW_MODES,
+    SORT_MODES,
+    ViewMemo,
+    diff_edits,
+    page_count,
+    page_slice,
+    to_df,
+    validate_edit,
+)
 
 st.set_page_config(page_title="Todoリスト", layout="wide")
 
 st.title("🧠 Todoリスト（Googleスプレッドシート保存）")
 
-# =========================
-# 定数
-# =========================
-PRIORITY_CHOICES = ["High", "Medium", "Low"]
-PRIORITY_ORDER = {"High": 3, "Medium": 2, "Low": 1}
+# 一覧の1ページの件数（表に送るのは表示中のページだけ）
+PAGE_SIZE = int(os.environ.get("TODO_PAGE_SIZE", "50"))
+PAGE_SIZE_CHOICES = sorted({25, 50, 100, 200, PAGE_SIZE})
 
 # =========================
-# ユーティリティ
+# データ取得（セッションにDataFrameを持ち、データが変わったときだけ作り直す）
 # =========================
-def _to_df(rows):
-    # priority列を追加した版
-    base_cols = ["id", "title", "body", "due_date", "priority", "created_at", "updated_at"]
-
-    if not rows:
-        return pd.DataFrame(columns=base_cols)
-
-    df = pd.DataFrame(rows)
-
-    # 欠けてても落ちないように（旧シートでも動く）
-    for c in base_cols:
-        if c not in df.columns:
-            df[c] = ""
-
-    # due_dateを日付に寄せる（変換できないものはNaT）
-    df["due_date"] = pd.to_datetime(df["due_date"], errors="coerce").dt.date
-    df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce")
-    df["updated_at"] = pd.to_datetime(df["updated_at"], errors="coerce")
-
-    # priority正規化（想定外は空に）
-    df["priority"] = df["priority"].fillna("").astype(str)
-    df.loc[~df["priority"].isin(PRIORITY_CHOICES), "priority"] = ""
-
+def _load_df():
+    """
+    Streamlitはウィジェット操作のたびに全体を再実行するので、
+    sheets_db のバージョンが変わらない限り前回のDataFrameを使う。
+    （sheets_db側もTTL内ならAPIを呼ばない。TTL後は更新時刻の確認だけ）
+    """
+    state = st.session_state
+    if "todo_df" in state and state.get("todo_version") == check_version():
+        return state["todo_df"]
+
+    version, rows = snapshot()
+    state["todo_df"] = to_df(rows)
+    state["todo_version"] = version
+    return state["todo_df"]
+
+
+def _drop_df():
+    st.session_state.pop("todo_df", None)
+    st.session_state.pop("todo_version", None)
+
+
+def _apply_write(before: int, patch):
+    """
+    自分の書き込みをセッションのDataFrameに直接反映する（取り直さない）。
+    before: 書き込み直前の data_version。間に他の変更が挟まっていたら作り直しに回す。
+    """
+    state = st.session_state
+    after = data_version()
+    if "todo_df" in state and state.get("todo_version") == before and after == before + 1:
+        state["todo_df"] = patch(state["todo_df"])
+        state["todo_version"] = after
+    else:
+        _drop_df()
+
+
+def _now_ts():
+    # sheets_db の created_at/updated_at と同じ秒精度
+    return pd.Timestamp(datetime.now().replace(microsecond=0))
+
+
+def _patch_added(df, todo_id, title, body, due, priority, owner=""):
+    now = _now_ts()
+    row = to_df([{
+        "id": todo_id,
+        "title": title,
+        "body": body,
+        "due_date": str(due),
+        "priority": priority,
+        "created_at": now,
+        "updated_at": now,
+        "owner": owner,
+    }])
+    return pd.concat([df, row[df.columns]], ignore_index=True) if len(df) else row
+
+
+def _patch_updated(df, changes: dict):
+    """changes: {id: {列: 値}}"""
+    df = df.copy()
+    now = _now_ts()
+    pos = pd.Series(df.index, index=df["id"].astype(str))
+    for todo_id, fields in changes.items():
+        if todo_id not in pos.index:
+            continue
+        i = pos[todo_id]
+        for k, v in fields.items():
+            if k == "due_date":
+                v = pd.to_datetime(str(v), errors="coerce")
+                v = None if pd.isna(v) else v.date()
+            df.at[i, k] = v
+        df.at[i, "updated_at"] = now
     return df
 
 
-def _fmt_dt(x):
-    if pd.isna(x):
-        return ""
-    if isinstance(x, (datetime, pd.Timestamp)):
-        return x.strftime("%Y-%m-%d %H:%M")
-    return str(x)
+def _save_edits(pending: dict) -> list[dict]:
+    """
+    表で直接編集した変更を検証し、通ったものを update_todos 1回（batch_update 1回）で書く。
+    戻り値: 1行ごとの結果（画面に出す用）。保存できた行は pending から消す
+    """
+    checked = {todo_id: validate_edit(fields) for todo_id, fields in pending.items()}
+    valid = {todo_id: fields for todo_id, (fields, err) in checked.items() if not err}
+
+    result = {}
+    if valid:
+        before = data_version()
+        result = update_todos([dict(fields, id=todo_id) for todo_id, fields in valid.items()])
+        saved = {todo_id: fields for todo_id, fields in valid.items() if result.get(todo_id)}
+        _apply_write(before, lambda d: _patch_updated(d, saved))
+
+    report = []
+    for todo_id, (fields, err) in checked.items():
+        if err:
+            status = f"エラー: {err}"
+        elif result.get(todo_id):
+            status = "保存しました"
+            del pending[todo_id]
+        else:
+            status = "見つかりません（削除済み？）"
+            del pending[todo_id]
+        report.append({"id": todo_id, "変更した列": ", ".join(fields), "結果": status})
+    return report
 
 
-def _priority_num(p: str) -> int:
-    return PRIORITY_ORDER.get(str(p), 0)
+def _patch_removed(df, todo_ids):
+    return df[~df["id"].astype(str).isin(set(todo_ids))].reset_index(drop=True)
+
 
-# =========================
-# データ取得
-# =========================
 try:
-    rows = list_todos()
-    df = _to_df(rows)
+    df = _load_df()
 except Exception as e:
     st.error(f"データ取得エラー: {e}")
     st.stop()
@@ -89,7 +174,11 @@ with st.container(border=True):
             st.warning("タイトルは必須です。")
         else:
             try:
-                add_todo(new_title.strip(), new_body.strip(), new_due, new_priority)
+                before = data_version()
+                new_id = add_todo(new_title.strip(), new_body.strip(), new_due, new_priority)
+                _apply_write(before, lambda d: _patch_added(
+                    d, new_id, new_title.strip(), new_body.strip(), new_due, new_priority
+                ))
                 st.success("追加しました！")
                 st.rerun()
             except Exception as e:
@@ -108,64 +197,65 @@ with st.container(border=True):
     with f1:
         q = st.text_input("検索（タイトル/内容）", placeholder="キーワードで絞り込み")
     with f2:
-        show_mode = st.selectbox("表示", ["すべて", "期限ありのみ", "期限なしのみ"])
+        show_mode = st.selectbox("表示", SHOW_MODES)
     with f3:
         pr_filter = st.selectbox("重要度", ["すべて"] + PRIORITY_CHOICES)
     with f4:
-        sort_mode = st.selectbox("並び順", ["更新が新しい順", "期限が近い順", "重要度が高い順", "タイトル順"])
+        sort_mode = st.selectbox("並び順", SORT_MODES)
     with f5:
         st.write("")
         reload_clicked = st.button("再読み込み", use_container_width=True)
 
     if reload_clicked:
+        # キャッシュを捨ててSheetsから取り直す
+        invalidate_cache()
+        _drop_df()
         st.rerun()
 
-    view = df.copy()
-
-    # 検索
-    if q.strip():
-        key = q.strip().lower()
-        view = view[
-            view["title"].fillna("").str.lower().str.contains(key)
-            | view["body"].fillna("").str.lower().str.contains(key)
-        ]
-
-    # 表示モード
-    if show_mode == "期限ありのみ":
-        view = view[view["due_date"].notna()]
-    elif show_mode == "期限なしのみ":
-        view = view[view["due_date"].isna()]
-
-    # priorityフィルタ
-    if pr_filter != "すべて":
-        view = view[view["priority"] == pr_filter]
-
-    # 並び順
-    if sort_mode == "更新が新しい順":
-        view = view.sort_values("updated_at", ascending=False)
-    elif sort_mode == "期限が近い順":
-        # due_dateがNaTのものは最後へ
-        view = view.sort_values(["due_date", "updated_at"], ascending=[True, False], na_position="last")
-    elif sort_mode == "重要度が高い順":
-        view = view.copy()
-        view["priority_num"] = view["priority"].apply(_priority_num)
-        view = view.sort_values(["priority_num", "due_date", "updated_at"], ascending=[False, True, False], na_position="last")
-        view = view.drop(columns=["priority_num"])
-    else:
-        view = view.sort_values("title", ascending=True)
-
-    # 表示用に整形（編集には元データを使う）
-    display = view.copy()
-    display["created_at"] = display["created_at"].apply(_fmt_dt)
-    display["updated_at"] = display["updated_at"].apply(_fmt_dt)
-    display["due_date"] = display["due_date"].astype("string")
+    # 検索・絞り込み・並べ替え（同じデータ・同じ条件なら前回の結果をそのまま使う）
+    state = st.session_state
+    if "view_memo" not in state:
+        state["view_memo"] = ViewMemo()
+    view = state["view_memo"].view(state["todo_version"], df, q, show_mode, pr_filter, sort_mode)
+
+    # 選択はidで持つ（ページや絞り込みを変えても消えない）。削除済みのidは落とす
+    selected_ids = state.setdefault("selected_ids", set())
+    selected_ids &= set(df["id"].astype(str))
+
+    # ページ送り（条件が変わったら1ページ目に戻す）
+    view_key = (q.strip(), show_mode, pr_filter, sort_mode)
+    if state.get("view_key") != view_key:
+        state["view_key"] = view_key
+        state["page"] = 1
+
+    p1, p2, p3 = st.columns([1, 1, 3])
+    with p2:
+        page_size = st.selectbox("表示件数", PAGE_SIZE_CHOICES, index=PAGE_SIZE_CHOICES.index(PAGE_SIZE))
+    n_pages = page_count(len(view), page_size)
+    state["page"] = min(state.get("page", 1), n_pages)
+    with p1:
+        page = st.number_input("ページ", min_value=1, max_value=n_pages, step=1, key="page")
+    with p3:
+        start = (page - 1) * page_size
+        st.caption(
+            f"{len(view)}件中 {min(start + 1, len(view))}〜{min(start + page_size, len(view))}件"
+            f"（{page}/{n_pages}ページ）・選択中 {len(selected_ids)}件"
+        )
+        if selected_ids and st.button("選択を解除"):
+            selected_ids.clear()
+            st.rerun()
 
-    # 選択のためのindexを付与
-    display = display.reset_index(drop=True)
     st.caption("行を選んで下の「編集」で更新できます。")
 
-    # data_editor で行選択（チェック）
-    display.insert(0, "選択", False)
+    # 表に渡すのは表示中のページだけ。未保存の直接編集は上に重ねて見せる
+    pending = state.setdefault("pending_edits", {})
+    source = page_slice(view, page, page_size)
+    display = source.copy()
+    ids_on_page = display["id"].astype(str)
+    for i, todo_id in zip(display.index, ids_on_page):
+        for k, v in pending.get(todo_id, {}).items():
+            display.at[i, k] = v
+    display.insert(0, "選択", ids_on_page.isin(selected_ids))
 
     edited = st.data_editor(
         display,
@@ -180,11 +270,55 @@ with st.container(border=True):
             "priority": st.column_config.SelectboxColumn("重要度", options=PRIORITY_CHOICES, width="small"),
             "created_at": st.column_config.TextColumn("作成", disabled=True, width="medium"),
             "updated_at": st.column_config.TextColumn("更新", disabled=True, width="medium"),
+            "owner": st.column_config.TextColumn("担当", width="small"),
         },
         disabled=["id", "created_at", "updated_at"],
-        key="table",
+        # 編集内容は行位置で覚えられるので、ページ・条件・データが変わったら別の表として扱う
+        key=f"table:{state['todo_version']}:{hash(view_key)}:{page}:{page_size}:{state.get('editor_nonce', 0)}",
     )
 
+    # このページの直接編集を未保存の変更として持つ（元に戻した行は消える）
+    page_edits = diff_edits(source, edited)
+    for todo_id in ids_on_page:
+        pending.pop(todo_id, None)
+        if todo_id in page_edits:
+            pending[todo_id] = page_edits[todo_id]
+
+    if pending:
+        s1, s2, s3 = st.columns([3, 1, 1])
+        with s1:
+            st.warning(f"未保存の変更が{len(pending)}件あります（他のページの分も含む）。")
+        with s2:
+            save_all_clicked = st.button("変更をすべて保存", type="primary", use_container_width=True)
+        with s3:
+            discard_clicked = st.button("変更を破棄", use_container_width=True)
+
+        if save_all_clicked:
+            try:
+                state["save_report"] = _save_edits(pending)
+            except Exception as e:
+                st.error(f"保存エラー: {e}")
+            else:
+                state["editor_nonce"] = state.get("editor_nonce", 0) + 1
+                st.rerun()
+        if discard_clicked:
+            pending.clear()
+            state["editor_nonce"] = state.get("editor_nonce", 0) + 1
+            st.rerun()
+
+    report = state.pop("save_report", None)
+    if report:
+        n_ok = sum(r["結果"] == "保存しました" for r in report)
+        st.success(f"{n_ok}/{len(report)}件を保存しました。")
+        st.dataframe(pd.DataFrame(report), hide_index=True, use_container_width=True)
+
+    # このページのチェック状態を選択に反映
+    for todo_id, checked in zip(edited["id"].astype(str), edited["選択"]):
+        if checked:
+            selected_ids.add(todo_id)
+        else:
+            selected_ids.discard(todo_id)
+
 st.write("")
 
 # =========================
@@ -193,16 +327,24 @@ st.write("")
 with st.container(border=True):
     st.subheader("✏️ 編集（選択した1件を更新 / 削除）")
 
-    # 選択行を取得
-    selected = edited[edited["選択"] == True]  # noqa: E712
-    if len(selected) == 0:
+    # 選択行を取得（別ページで選んだ行も対象）
+    if len(selected_ids) == 0:
         st.info("一覧で1件選択してください。")
         st.stop()
-    if len(selected) > 1:
+    if len(selected_ids) > 1:
         st.warning("編集は1件ずつです。1件だけ選択してください。")
         st.stop()
 
-    row = selected.iloc[0].to_dict()
+    (selected_id,) = selected_ids
+    on_page = edited[edited["id"].astype(str) == selected_id]
+    if len(on_page):
+        row = on_page.iloc[0].to_dict()
+    else:
+        row = view[view["id"].astype(str) == selected_id]
+        if len(row) == 0:
+            st.info("選択中の行は今の絞り込み条件では表示されていません。")
+            st.stop()
+        row = row.iloc[0].to_dict()
 
     # 入力フォーム
     e1, e2, e3 = st.columns([2, 1, 1])
@@ -236,7 +378,11 @@ with st.container(border=True):
             st.warning("タイトルは必須です。")
         else:
             try:
+                before = data_version()
                 update_todo(row["id"], etitle.strip(), ebody.strip(), edue, epriority)
+                _apply_write(before, lambda d: _patch_updated(d, {
+                    row["id"]: {"title": etitle.strip(), "body": ebody.strip(), "due_date": edue, "priority": epriority}
+                }))
                 st.success("更新しました！")
                 st.rerun()
             except Exception as e:
@@ -244,7 +390,9 @@ with st.container(border=True):
 
     if delete_clicked:
         try:
+            before = data_version()
             delete_todo(row["id"])
+            _apply_write(before, lambda d: _patch_removed(d, [row["id"]]))
             st.success("削除しました！")
             st.rerun()
         except Exception as e:
@@ -0,0 +1,138 @@
+"""
+parse_date_jp のマイクロベンチマーク（旧実装との比較）
+
+使い方: python bench_parse_date.py [回数]
+"""
+import re
+import sys
+import time
+from datetime import date, timedelta
+
+from jp_date import _parse_range, parse_date_jp
+
+MESSAGES = [
+    "2月14日の予定",
+    "2/14の予定",
+    "今日の予定",
+    "明日の予定",
+    "14日の予定",
+    "来週の打ち合わせってどうなってたっけ？明日の予定も教えて",
+    "こんにちは",
+    "予定を教えてください。よろしくお願いします。" * 3,
+]
+
+
+# ==========
+# 旧実装（比較用にそのまま残す）
+# ==========
+def legacy_parse_date_jp(text: str, today: date | None = None) -> date | None:
+    """
+    対応（MVP）：
+      - '2月14日'（最優先）
+      - '2/14' or '2-14'
+      - '今日', '明日'
+      - '14日'（今月。過去なら翌月）
+    """
+    if today is None:
+        today = date.today()
+
+    t = (text or "").strip()
+
+    # 1) 「2月14日」
+    m = re.search(r"(\d{1,2})\s*月\s*(\d{1,2})\s*日", t)
+    if m:
+        month = int(m.group(1))
+        day = int(m.group(2))
+        y = today.year
+        try:
+            d = date(y, month, day)
+        except ValueError:
+            return None
+        # 過去なら来年にスライド（自然な挙動）
+        if d < today:
+            try:
+                d = date(y + 1, month, day)
+            except ValueError:
+                return None
+        return d
+
+    # 2) 「2/14」「2-14」
+    m = re.search(r"(\d{1,2})\s*[\/\-]\s*(\d{1,2})", t)
+    if m:
+        month = int(m.group(1))
+        day = int(m.group(2))
+        y = today.year
+        try:
+            d = date(y, month, day)
+        except ValueError:
+            return None
+        if d < today:
+            try:
+                d = date(y + 1, month, day)
+            except ValueError:
+                return None
+        return d
+
+    # 3) 今日/明日
+    if re.search(r"(今日|きょう)", t):
+        return today
+    if re.search(r"(明日|あした)", t):
+        return today + timedelta(days=1)
+
+    # 4) 「14日」だけ（今月。過去なら翌月）
+    m = re.search(r"(\d{1,2})\s*日", t)
+    if m:
+        day = int(m.group(1))
+        y = today.year
+        month = today.month
+        try:
+            d = date(y, month, day)
+        except ValueError:
+            return None
+        if d < today:
+            # 翌月へ
+            month2 = 1 if month == 12 else month + 1
+            y2 = y + 1 if month == 12 else y
+            try:
+                d = date(y2, month2, day)
+            except ValueError:
+                return None
+        return d
+
+    return None
+
+
+def _bench(fn, n: int, clear=None) -> float:
+    """1メッセージあたりの平均マイクロ秒"""
+    today = date(2026, 2, 1)
+    start = time.perf_counter()
+    for _ in range(n):
+        if clear:
+            clear()
+        for m in MESSAGES:
+            fn(m, today)
+    return (time.perf_counter() - start) / (n * len(MESSAGES)) * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    # 結果が旧実装と一致すること（旧実装が読めるもの）
+    today = date(2026, 2, 1)
+    for m in MESSAGES:
+        old = legacy_parse_date_jp(m, today)
+        if old is not None:
+            assert parse_date_jp(m, today) == old, m
+
+    legacy = _bench(legacy_parse_date_jp, n)
+    cold = _bench(parse_date_jp, n, clear=_parse_range.cache_clear)
+    warm = _bench(parse_date_jp, n)
+
+    print(f"messages: {len(MESSAGES)} x {n}")
+    print(f"legacy          : {legacy:7.2f} us/msg")
+    print(f"new (no memo)   : {cold:7.2f} us/msg")
+    print(f"new (memoized)  : {warm:7.2f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
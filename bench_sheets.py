@@ -0,0 +1,288 @@
+"""
+sheets_db まわりのベンチマーク＋API呼び出し回数の回帰チェック
+
+gspread の代わりに fake_gspread（メモリ上のシート）を使うので、認証もネットワークも不要。
+操作ごとに 実時間 / API呼び出し回数 / 送受信バイト数 / 模擬時間（遅延＋クォータ待ち）を測り、
+API呼び出し回数が bench_baseline.json より増えていたら終了コード1で失敗する。
+始めに、列順のずれたシートを migrate_schema() で直せるかも確かめる（だめなら終了コード1）。
+
+使い方:
+  python bench_sheets.py                          # 100 / 10,000 / 100,000 行
+  python bench_sheets.py --sizes 100,10000
+  python bench_sheets.py --latency 0.15 --quota 60
+  python bench_sheets.py --update-baseline        # 今の回数を基準として保存
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+# 本物の認証・LINEには触らない（import前に設定）
+os.environ["SHEET_URL"] = "https://example.invalid/bench"
+os.environ["TODO_BACKEND"] = "sheets"
+os.environ["SHEETS_WRITE_BEHIND"] = ""
+os.environ["SHEETS_CHANGELOG"] = ""
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "bench")
+os.environ.setdefault("LINE_CHANNEL_SECRET", "bench")
+os.environ.setdefault("LINE_USER_ID", "Ubench")
+
+import sheets_db  # noqa: E402
+import todo_store  # noqa: E402
+from fake_gspread import ApiMeter, FakeSpreadsheet, _size  # noqa: E402
+from todo_view import SHOW_MODES, SORT_MODES, ViewMemo, page_slice, to_df  # noqa: E402
+
+SIZES = [100, 10_000, 100_000]
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+PRIORITIES = ["High", "Medium", "Low", ""]
+
+
+# ==========
+# 準備
+# ==========
+def make_rows(n: int, today: date) -> list[list[str]]:
+    """n行のタスク（期日は今日の前後60日に散らす。1割は期日なし）"""
+    rows = []
+    for i in range(n):
+        due = "" if i % 10 == 9 else (today + timedelta(days=i % 121 - 60)).strftime("%Y-%m-%d")
+        ts = f"2026-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}"
+        rows.append([
+            str(uuid.UUID(int=i + 1)),
+            f"タスク{i}",
+            f"メモ{i} " * (i % 5),
+            due,
+            PRIORITIES[i % len(PRIORITIES)],
+            ts,
+            ts,
+            "" if i % 3 else f"owner{i % 7}",
+        ])
+    return rows
+
+
+class _Creds:
+    expiry = None
+
+
+def install(rows, meter: ApiMeter):
+    """sheets_db の接続先を、rows を入れた手元のシートに差し替える"""
+    ss = FakeSpreadsheet(meter)
+    ws = ss.add_worksheet(
+        sheets_db.WORKSHEET_NAME, cols=len(sheets_db.HEADERS), rows_data=[sheets_db.HEADERS] + rows
+    )
+    sheets_db._reset_client()
+    sheets_db._connect = lambda repair_headers=True: {
+        "creds": _Creds(), "gc": None, "ss": ss, "ws": ws, "schema_ok": True, "header_ok": True, "log": None,
+    }
+    sheets_db._row_index = None
+    sheets_db.invalidate_cache()
+    todo_store.set_store(todo_store.SheetsStore())
+
+
+def check_migration() -> list[str]:
+    """
+    列の入れ替わったシート（priority が due_date の前）を、接続時のヘッダー確認から
+    migrate_schema() まで本物の処理で通し、値が正しい列に戻るかを見る
+    """
+    header = ["id", "title", "body", "priority", "due_date", "created_at", "updated_at", "owner"]
+    row = ["a", "T", "B", "High", "2026-01-02", "2026-01-01 00:00:00", "2026-01-01 00:00:00", "me"]
+    ss = FakeSpreadsheet(ApiMeter())
+    ss.add_worksheet(sheets_db.WORKSHEET_NAME, cols=len(header), rows_data=[header, row])
+    sheets_db._reset_client()
+    sheets_db._connect = lambda repair_headers=True: dict(
+        sheets_db._open_sheets(ss, repair_headers), creds=_Creds(), gc=None
+    )
+    sheets_db._row_index = None
+    sheets_db.invalidate_cache()
+
+    failures = []
+    sheets_db.list_todos()
+    if ss.sheets[sheets_db.WORKSHEET_NAME].rows[0] != header:
+        failures.append("migration: header was relabelled on connect")
+    try:
+        sheets_db.update_todo("a", "T2", "B", None, "Low")
+        failures.append("migration: write to a misordered sheet was not refused")
+    except RuntimeError:
+        pass
+
+    sheets_db.migrate_schema()
+    got = {r["id"]: r for r in sheets_db.list_todos()}.get("a", {})
+    want = dict(zip(header, row))
+    for key in sheets_db.HEADERS:
+        if got.get(key) != want[key]:
+            failures.append(f"migration: {key} = {got.get(key)!r}, want {want[key]!r}")
+    return failures
+
+
+class FakeLineApi:
+    """remind.py の送信先（MessagingApi の代わり）。呼び出し回数と送信バイト数を数える"""
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+
+    def _send(self, req):
+        self.calls += 1
+        self.bytes += _size(req.to_dict())
+
+    def push_message(self, req, x_line_retry_key=None):
+        self._send(req)
+
+    def multicast(self, req, x_line_retry_key=None):
+        self._send(req)
+
+
+# ==========
+# 操作（setup で状態を作り、op だけを測る）
+# ==========
+def operations(today: date):
+    import line_webhook
+    import remind
+
+    line = FakeLineApi()
+    remind.get_messaging_api = lambda: line
+
+    def warm():
+        sheets_db.list_todos()
+
+    def target_id(rows):
+        return rows[len(rows) // 2][0]
+
+    def view_pipeline():
+        version, rows = todo_store.snapshot()
+        memo = ViewMemo()
+        view = memo.view(version, to_df(rows), "", SHOW_MODES[0], "すべて", SORT_MODES[0])
+        page_slice(view, 1, 50)
+        # 条件を変えたとき（2回目以降の再実行）
+        view = memo.view(version, to_df(rows), "タスク1", SHOW_MODES[1], "High", SORT_MODES[1])
+        page_slice(view, 1, 50)
+
+    def remind_main():
+        with contextlib.redirect_stdout(io.StringIO()):
+            remind.main()
+
+    # (名前, setup(rows), op(rows))。setup の前に毎回まっさらなシートを用意する
+    ops = [
+        ("list_todos", None, lambda rows: sheets_db.list_todos()),
+        ("list_todos(columns)", None, lambda rows: sheets_db.list_todos(line_webhook.INDEX_COLUMNS)),
+        ("list_todos(warm)", warm, lambda rows: sheets_db.list_todos()),
+        ("add_todo", warm, lambda rows: todo_store.add_todo("ベンチ", "本文", today, "High")),
+        ("update_todo", warm, lambda rows: todo_store.update_todo(target_id(rows), "更新", "本文", today, "Low")),
+        ("delete_todo", warm, lambda rows: todo_store.delete_todo(target_id(rows))),
+        ("fetch_tasks_by_date", None, lambda rows: line_webhook.fetch_tasks_by_date(today)),
+        ("remind.main", None, lambda rows: remind_main()),
+        ("view_pipeline", None, lambda rows: view_pipeline()),
+    ]
+    return ops, line
+
+
+def run(sizes, latency, quota, sleep):
+    today = date.today()
+    meter = ApiMeter(latency=latency, quota_per_min=quota, sleep=sleep)
+    ops, line = operations(today)
+
+    results = {}
+    for n in sizes:
+        rows = make_rows(n, today)
+        for name, setup, op in ops:
+            install(rows, meter)
+            if setup is not None:
+                setup()
+            meter.reset()
+            line.calls = line.bytes = 0
+            gc.collect()
+
+            t0 = time.perf_counter()
+            op(rows)
+            wall = time.perf_counter() - t0
+
+            r = meter.snapshot()
+            results.setdefault(name, {})[str(n)] = {
+                "wall_ms": round(wall * 1000, 2),
+                "api_calls": r["api_calls"],
+                "bytes": r["bytes"],
+                "sim_ms": round(r["sim_s"] * 1000, 1),
+                "throttled": r["throttled"],
+                "line_calls": line.calls,
+                "line_bytes": line.bytes,
+            }
+            print(
+                f"{name:22s} {n:>7d} rows  {wall * 1000:9.2f} ms  api={r['api_calls']:<3d} "
+                f"bytes={r['bytes']:<10d} sim={r['sim_s'] * 1000:8.1f} ms"
+                + (f"  line={line.calls}" if line.calls else "")
+            )
+    return results
+
+
+# ==========
+# 回帰チェック（API呼び出し回数が増えたら失敗）
+# ==========
+def check(results, baseline) -> list[str]:
+    failures = []
+    for name, by_size in results.items():
+        for n, r in by_size.items():
+            base = baseline.get(name, {}).get(n)
+            if base is None:
+                continue
+            for key in ("api_calls", "line_calls"):
+                if r[key] > base.get(key, 0):
+                    failures.append(f"{name} @ {n} rows: {key} {base.get(key, 0)} → {r[key]}")
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default=",".join(str(n) for n in SIZES))
+    ap.add_argument("--latency", type=float, default=0.0, help="1回のAPI呼び出しの往復秒数（模擬）")
+    ap.add_argument("--quota", type=int, default=None, help="1分あたりのAPI呼び出し上限（模擬）")
+    ap.add_argument("--sleep", action="store_true", help="遅延・待ちを実際にsleepする")
+    ap.add_argument("--json", help="結果をこのパスへJSONで書き出す")
+    ap.add_argument("--update-baseline", action="store_true")
+    args = ap.parse_args()
+
+    failures = check_migration()
+    if failures:
+        for line in failures:
+            print(line)
+        sys.exit(1)
+
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+    results = run(sizes, args.latency, args.quota, args.sleep)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH, encoding="utf-8") as f:
+                baseline = json.load(f)
+        for name, by_size in results.items():
+            for n, r in by_size.items():
+                baseline.setdefault(name, {})[n] = {"api_calls": r["api_calls"], "line_calls": r["line_calls"]}
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline updated: {BASELINE_PATH}")
+        return
+
+    if not os.path.exists(BASELINE_PATH):
+        print("no baseline (run with --update-baseline)")
+        return
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        failures = check(results, json.load(f))
+    if failures:
+        print("\nAPI calls increased:")
+        for line in failures:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nOK: API calls per operation did not increase")
+
+
+if __name__ == "__main__":
+    main()
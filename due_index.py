@@ -0,0 +1,134 @@
+"""
+due_date → タスク一覧 の索引（LINE Bot / リマインド共通）
+
+取得結果（スナップショット）ごとに1回だけ作り、日付の問い合わせは辞書引き、
+期間の問い合わせはソート済みの日付配列を二分探索して返す。
+"""
+import bisect
+import threading
+from datetime import date, timedelta
+
+from todo_schema import parse_due_date
+from todo_store import archive_cutoff, list_archived, snapshot
+
+PRIORITY_ORDER = {"High": 3, "Medium": 2, "Low": 1}
+
+
+# ==========
+# 日付正規化（表記ゆれに強い）
+# ==========
+def normalize_due_date_str(s) -> str:
+    """Sheetsのdue_date値を 'YYYY-MM-DD' に寄せる（読めなければ空文字）"""
+    d = parse_due_date(s)
+    return d.strftime("%Y-%m-%d") if d else ""
+
+
+def priority_num(p) -> int:
+    # 既存priorityが無い/空でもOK
+    return PRIORITY_ORDER.get(str(p), 0)
+
+
+def task_sort_key(t: dict):
+    # priority desc → title asc
+    return (-priority_num(t.get("priority", "")), str(t.get("title", "")))
+
+
+# ==========
+# 索引
+# ==========
+class DueIndex:
+    def __init__(self, rows: list[dict]):
+        buckets: dict[date, list[dict]] = {}
+        for r in rows:
+            d = parse_due_date(r.get("due_date", ""))
+            if d is None:
+                continue
+            buckets.setdefault(d, []).append(r)
+
+        for tasks in buckets.values():
+            tasks.sort(key=task_sort_key)
+        self._buckets = buckets
+        self._dates = sorted(buckets)
+
+    def on(self, target: date) -> list[dict]:
+        """target日のタスク（並び替え済み。呼び出し側で書き換えてよいコピー）"""
+        return [dict(t) for t in self._buckets.get(target, [])]
+
+    def between(self, start: date | None, end: date | None) -> list[tuple[date, list[dict]]]:
+        """
+        start〜end（両端含む）でタスクがある日だけ [(日付, タスク), ...]（古い順）。
+        None はその側に制限なし。
+        """
+        i = 0 if start is None else bisect.bisect_left(self._dates, start)
+        j = len(self._dates) if end is None else bisect.bisect_right(self._dates, end)
+        return [(d, self.on(d)) for d in self._dates[i:j]]
+
+    def before(self, end: date) -> list[tuple[date, list[dict]]]:
+        """end以前（end含む）でタスクがある日だけ、古い順に"""
+        return self.between(None, end)
+
+
+_memo: dict = {}  # columns → (data_version, DueIndex)
+_memo_lock = threading.Lock()
+
+
+def get_due_index(columns=None) -> DueIndex:
+    """
+    現在のデータの索引を返す。データが変わっていなければ前回の索引を使い回す。
+    columns は list_todos と同じ（必要な列だけ取る）。
+    """
+    version, rows = snapshot(columns)
+    key = tuple(columns) if columns else None
+
+    with _memo_lock:
+        hit = _memo.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+
+    index = DueIndex(rows)
+    with _memo_lock:
+        _memo[key] = (version, index)
+    return index
+
+
+# ==========
+# アーカイブ（月別）から引く
+# ==========
+def _months(start: date, end: date) -> list[str]:
+    """start〜end にかかる月 ["2026-08", "2026-09", ...]"""
+    out = []
+    y, m = start.year, start.month
+    while (y, m) <= (end.year, end.month):
+        out.append(f"{y:04d}-{m:02d}")
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return out
+
+
+def archived_between(start: date | None, end: date, columns=None, today: date | None = None):
+    """
+    start〜end のうち、アーカイブされうる期間（archive_old_todos が実際に使った基準日より前）だけを
+    月別アーカイブから読んで [(日付, タスク), ...] で返す。start が None なら読まない。
+    """
+    # 基準日は今日より後にならないので、今日以降だけの問い合わせは基準日も読まない
+    if start is None or start >= (today or date.today()):
+        return []
+    cutoff = archive_cutoff()
+    if cutoff is None:
+        return []
+    end = min(end, cutoff - timedelta(days=1))
+    if start > end:
+        return []
+
+    rows = []
+    for month in _months(start, end):
+        rows.extend(list_archived(month, columns))
+    return DueIndex(rows).between(start, end) if rows else []
+
+
+def merge_days(*day_lists) -> list[tuple[date, list[dict]]]:
+    """between() の結果どうしを日付ごとにまとめる（古い順・日付内は並び替え済み）"""
+    merged: dict[date, list[dict]] = {}
+    for days in day_lists:
+        for d, tasks in days:
+            merged.setdefault(d, []).extend(tasks)
+    return [(d, sorted(merged[d], key=task_sort_key)) for d in sorted(merged)]
@@ -0,0 +1,301 @@
+"""
+gspread の Spreadsheet / Worksheet の手元版（ベンチマーク用）
+
+sheets_db が使うメソッドだけを、メモリ上の2次元リストで同じように動かす。
+呼び出しごとに ApiMeter が「API呼び出し1回」として数え、送受信のバイト数
+（JSONにしたときの大きさの見積もり）と、遅延・クォータを足した模擬時間を記録する。
+
+  meter = ApiMeter(latency=0.15, quota_per_min=60)
+  ss = FakeSpreadsheet(meter)
+  ws = ss.add_worksheet("todos", rows=1, cols=8)
+"""
+import json
+import re
+import time
+from collections import deque
+
+import gspread
+
+
+class ApiMeter:
+    """
+    latency: 1回あたりの往復時間（秒）
+    quota_per_min: 1分あたりの上限（超えたら枠が空くまで待つ。Noneは無制限）
+    sleep: True なら遅延・待ちを実際に sleep する（既定は模擬時間に足すだけ）
+    """
+
+    def __init__(self, latency: float = 0.0, quota_per_min: int | None = None, sleep: bool = False):
+        self.latency = latency
+        self.quota_per_min = quota_per_min
+        self.sleep = sleep
+        self.reset()
+
+    def reset(self):
+        self._window = deque()  # クォータ計算用の呼び出し時刻（模擬時間）
+        self.calls = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.sim_s = 0.0
+        self.throttled = 0
+
+    def call(self, name: str, request=None, response=None):
+        wait = 0.0
+        if self.quota_per_min:
+            while self._window and self._window[0] <= self.sim_s - 60.0:
+                self._window.popleft()
+            if len(self._window) >= self.quota_per_min:
+                wait = self._window[0] + 60.0 - self.sim_s
+                self.throttled += 1
+                self._window.popleft()
+            self._window.append(self.sim_s + wait)
+
+        self.calls.append(name)
+        self.bytes_sent += _size(request)
+        self.bytes_received += _size(response)
+        self.sim_s += wait + self.latency
+        if self.sleep and wait + self.latency > 0:
+            time.sleep(wait + self.latency)
+        return response
+
+    def snapshot(self) -> dict:
+        return {
+            "api_calls": len(self.calls),
+            "bytes": self.bytes_sent + self.bytes_received,
+            "sim_s": self.sim_s,
+            "throttled": self.throttled,
+        }
+
+
+def _size(obj) -> int:
+    """JSONにしたときのバイト数の見積もり（大きな2次元リストは文字数から概算）"""
+    if obj is None:
+        return 0
+    if isinstance(obj, list) and obj and isinstance(obj[0], list):
+        # ["a","b"] → 文字数 + 引用符とカンマ
+        return sum(len(str(c).encode()) + 3 for row in obj for c in row) + 2 * len(obj) + 2
+    return len(json.dumps(obj, ensure_ascii=False, default=str).encode())
+
+
+def _a1(a1: str):
+    """"B2:D" → (行1, 列1, 行2 or None, 列2 or None)"""
+    m = re.fullmatch(r"(?:[^!]*!)?([A-Z]+)?(\d+)?(?::([A-Z]+)?(\d+)?)?", a1)
+    c1, r1, c2, r2 = m.groups()
+
+    def col(c):
+        n = 0
+        for ch in c:
+            n = n * 26 + ord(ch) - 64
+        return n
+
+    single = m.group(0).find(":") < 0
+    return (
+        int(r1) if r1 else 1,
+        col(c1) if c1 else 1,
+        (int(r1) if single and r1 else (int(r2) if r2 else None)),
+        col(c2) if c2 else (col(c1) if single and c1 else None),
+    )
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title: str, sheet_id: int, rows=None, cols: int = 26):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.rows = [list(r) for r in (rows or [])]
+        self.col_count = cols
+        self._meter = spreadsheet.meter
+        self._formulas = False  # 数式セルがあるか（無ければ読み取りで評価しない）
+
+    # ---------- セル ----------
+    def _cell(self, r, c):
+        if r - 1 < len(self.rows) and c - 1 < len(self.rows[r - 1]):
+            v = self.rows[r - 1][c - 1]
+            # 変更ログ（sheets_db）で使う数式だけ評価する
+            if v == "=ROW()-1+$F$1":
+                return str(r - 1 + int(self._cell(1, 6) or 0))
+            if v == "=COUNTA(A2:A)+F1":
+                return str(sum(1 for x in self.rows[1:] if x and x[0]) + int(self._cell(1, 6) or 0))
+            return v
+        return ""
+
+    def _set(self, r, c, v):
+        while len(self.rows) < r:
+            self.rows.append([])
+        row = self.rows[r - 1]
+        while len(row) < c:
+            row.append("")
+        row[c - 1] = v
+        if isinstance(v, str) and v.startswith("="):
+            self._formulas = True
+
+    def _write(self, a1, values):
+        r1, c1, _, _ = _a1(a1)
+        for i, row in enumerate(values):
+            for j, v in enumerate(row):
+                self._set(r1 + i, c1 + j, v)
+
+    def _range(self, a1, major_dimension=None):
+        r1, c1, r2, c2 = _a1(a1)
+        r2 = r2 or len(self.rows)
+        c2 = c2 or max([len(r) for r in self.rows] + [c1])
+        vals = [_trim([self._cell(r, c) for c in range(c1, c2 + 1)]) for r in range(r1, r2 + 1)]
+        if major_dimension == "COLUMNS":
+            width = max([len(v) for v in vals] + [0])
+            vals = [_trim([v[j] if j < len(v) else "" for v in vals]) for j in range(width)]
+        while vals and not vals[-1]:
+            vals.pop()
+        return vals
+
+    # ---------- 読み取り ----------
+    def get_all_values(self, **kw):
+        if self._formulas:
+            out = [[self._cell(i + 1, j + 1) for j in range(len(r))] for i, r in enumerate(self.rows)]
+        else:
+            out = [list(r) for r in self.rows]
+        return self._meter.call("values.get", {"range": self.title}, out)
+
+    def get_all_records(self, **kw):
+        values = self.get_all_values()
+        if not values:
+            return []
+        header = values[0]
+        return [{k: (r[i] if i < len(r) else "") for i, k in enumerate(header)} for r in values[1:]]
+
+    def row_values(self, n, **kw):
+        out = _trim(self.rows[n - 1]) if n <= len(self.rows) else []
+        self._meter.call("values.get", {"range": f"{n}:{n}"}, [out])
+        return out
+
+    def col_values(self, n, **kw):
+        out = [r[n - 1] if n - 1 < len(r) else "" for r in self.rows]
+        out = _trim(out)
+        self._meter.call("values.get", {"range": f"C{n}"}, [[v] for v in out])
+        return out
+
+    def batch_get(self, ranges, major_dimension=None, **kw):
+        out = [self._range(a1, major_dimension) for a1 in ranges]
+        return self._meter.call("values.batchGet", list(ranges), out)
+
+    # ---------- 書き込み ----------
+    def append_row(self, row, **kw):
+        return self.append_rows([row], **kw)
+
+    def append_rows(self, rows, **kw):
+        start = len(self.rows) + 1
+        for row in rows:
+            self.rows.append([str(x) for x in row])
+        self.spreadsheet._touch()
+        resp = {"updates": {"updatedRange": f"{self.title}!A{start}:H{len(self.rows)}"}}
+        self._meter.call("values.append", [[str(x) for x in r] for r in rows], None)
+        return resp
+
+    def update(self, values=None, range_name=None, **kw):
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        if not isinstance(values, list):
+            values = [[values]]
+        self._write(range_name, values)
+        self.spreadsheet._touch()
+        return self._meter.call("values.update", values, None)
+
+    def batch_update(self, data, **kw):
+        for d in data:
+            self._write(d["range"], d["values"])
+        self.spreadsheet._touch()
+        return self._meter.call("values.batchUpdate", data, None)
+
+    def insert_cols(self, values, col=1, **kw):
+        for i, r in enumerate(self.rows):
+            while len(r) < col - 1:
+                r.append("")
+            r.insert(col - 1, values[0][i] if i < len(values[0]) else "")
+        self.spreadsheet._touch()
+        return self._meter.call("batchUpdate", values, None)
+
+    def add_cols(self, n):
+        self.col_count += n
+        self.spreadsheet._touch()
+        return self._meter.call("batchUpdate", {"appendDimension": n}, None)
+
+
+def _trim(v):
+    v = list(v)
+    while v and v[-1] == "":
+        v.pop()
+    return v
+
+
+class FakeSpreadsheet:
+    def __init__(self, meter: ApiMeter | None = None):
+        self.meter = meter or ApiMeter()
+        self.id = "fake-spreadsheet"
+        self.sheets = {}
+        self.metadata = []
+        self._modified = 0
+        self._next_id = 0
+
+    def _touch(self):
+        self._modified += 1
+
+    def _by_id(self, sheet_id):
+        return next(w for w in self.sheets.values() if w.id == sheet_id)
+
+    def worksheet(self, title):
+        self.meter.call("spreadsheets.get", {"title": title}, None)
+        if title not in self.sheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def worksheets(self):
+        self.meter.call("spreadsheets.get", None, [w.title for w in self.sheets.values()])
+        return list(self.sheets.values())
+
+    def add_worksheet(self, title, rows=100, cols=26, index=None, rows_data=None):
+        """rows_data はベンチマークの準備用（API呼び出しとして数えない）"""
+        if rows_data is None:
+            self.meter.call("batchUpdate", {"addSheet": title}, None)
+            self._touch()
+        ws = FakeWorksheet(self, title, self._next_id, rows_data, cols)
+        self._next_id += 1
+        self.sheets[title] = ws
+        return ws
+
+    def get_lastUpdateTime(self):
+        return self.meter.call("drive.files.get", None, str(self._modified))
+
+    def fetch_sheet_metadata(self, params=None):
+        out = {
+            "developerMetadata": list(self.metadata),
+            "sheets": [{"properties": {"title": t, "sheetId": w.id}} for t, w in self.sheets.items()],
+        }
+        return self.meter.call("spreadsheets.get", params, out)
+
+    def batch_update(self, body):
+        for req in body["requests"]:
+            if "deleteDimension" in req:
+                rng = req["deleteDimension"]["range"]
+                ws = self._by_id(rng["sheetId"])
+                del ws.rows[rng["startIndex"]:rng["endIndex"]]
+            elif "updateCells" in req:
+                u = req["updateCells"]
+                ws = self._by_id(u["start"]["sheetId"])
+                for i, row in enumerate(u["rows"]):
+                    for j, c in enumerate(row["values"]):
+                        v = next(iter(c["userEnteredValue"].values()))
+                        ws._set(u["start"]["rowIndex"] + i + 1, u["start"]["columnIndex"] + j + 1, str(v))
+            elif "appendCells" in req:
+                a = req["appendCells"]
+                ws = self._by_id(a["sheetId"])
+                for row in a["rows"]:
+                    ws.rows.append([])
+                    for j, c in enumerate(row["values"]):
+                        ws._set(len(ws.rows), j + 1, str(next(iter(c["userEnteredValue"].values()))))
+            elif "appendDimension" in req:
+                self._by_id(req["appendDimension"]["sheetId"]).col_count += req["appendDimension"]["length"]
+            elif "createDeveloperMetadata" in req:
+                self.metadata.append(dict(req["createDeveloperMetadata"]["developerMetadata"]))
+            elif "deleteDeveloperMetadata" in req:
+                key = req["deleteDeveloperMetadata"]["dataFilter"]["developerMetadataLookup"]["metadataKey"]
+                self.metadata = [m for m in self.metadata if m["metadataKey"] != key]
+        self._touch()
+        return self.meter.call("batchUpdate", body, {"replies": [{} for _ in body["requests"]]})
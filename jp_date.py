@@ -0,0 +1,209 @@
+"""
+日本語の日付表現パーサ（LINE Bot用）
+
+パターンは1本の正規表現にまとめてコンパイル済み。本文を1回なめてトークンを拾い、
+優先度の高いものから日付に解決する。結果は (text, today) ごとにメモ化。
+全角数字・記号も正規表現で直接拾う（正規表現の数字と int() は全角数字もそのまま扱える）。
+"""
+import re
+from datetime import date, timedelta
+from functools import lru_cache
+
+_WEEKDAYS = "月火水木金土日"
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?=[\d明あ今き来〜~～か])   # 先頭になり得ない文字の位置はすぐ飛ばす
+    (?:
+      (?P<md>(?P<md_m>\d{1,2})\s*月\s*(?P<md_d>\d{1,2})\s*日)
+    | (?P<slash>(?P<sl_m>\d{1,2})\s*[/\-／－]\s*(?P<sl_d>\d{1,2}))
+    | (?P<dayafter>明後日|あさって)
+    | (?P<today>今日|きょう)
+    | (?P<tomorrow>明日|あした)
+    | (?P<weekend>今週末)
+    | (?P<nextweek>来週\s*の?\s*(?P<nw_wd>[月火水木金土日])\s*曜日?)
+    | (?P<nextweekall>来週)
+    | (?P<thisweek>今週)
+    | (?P<span>(?P<sp_n>\d{1,3})\s*日間)
+    | (?P<day>(?P<dd>\d{1,2})\s*日)
+    | (?P<sep>〜|~|～|から)
+    )
+    """,
+    re.VERBOSE,
+)
+
+# 複数の表現があったときにどれを採るか（小さいほど優先）。「N日間」は日付の後ろでだけ使う
+_PRIORITY = {
+    k: i for i, k in enumerate([
+        "md", "slash", "today", "tomorrow", "dayafter",
+        "nextweek", "weekend", "thisweek", "nextweekall", "day",
+    ])
+}
+# 範囲の終わりに「D日」だけを置けるのは、始まりが暦の日付のとき（「2月14日から16日」）。
+# 「今日から3日」の「3日」は日付ではなく長さなので範囲にしない
+_CALENDAR = {"md", "slash", "day"}
+# これより長い範囲は、終わりが翌年にずれた逆順の範囲（「10/20〜10/14」）とみなす
+_MAX_RANGE = timedelta(days=183)
+
+
+def _tokenize(t: str) -> list[tuple[str, re.Match]]:
+    # lastgroup は外側のグループ名（md / slash / ... / sep）になる
+    return [(m.lastgroup, m) for m in _TOKEN_RE.finditer(t)]
+
+
+def _month_day(month: int, day: int, base: date) -> date | None:
+    """base以降で最初の month/day（過去なら来年にスライド）"""
+    try:
+        d = date(base.year, month, day)
+    except ValueError:
+        return None
+    if d < base:
+        try:
+            d = date(base.year + 1, month, day)
+        except ValueError:
+            return None
+    return d
+
+
+def _day_only(day: int, base: date) -> date | None:
+    """baseの月の day 日（過去なら翌月）"""
+    try:
+        d = date(base.year, base.month, day)
+    except ValueError:
+        return None
+    if d < base:
+        month2 = 1 if base.month == 12 else base.month + 1
+        y2 = base.year + 1 if base.month == 12 else base.year
+        try:
+            d = date(y2, month2, day)
+        except ValueError:
+            return None
+    return d
+
+
+def _resolve(kind: str, m: re.Match, today: date, base: date) -> tuple[date, date] | None:
+    """
+    1トークン → (開始日, 終了日)。単日なら同じ日。
+    base: 月日だけの表現をどこから先で探すか（範囲の終わりは開始日から）
+    """
+    d = None
+    if kind == "md":
+        d = _month_day(int(m.group("md_m")), int(m.group("md_d")), base)
+    elif kind == "slash":
+        d = _month_day(int(m.group("sl_m")), int(m.group("sl_d")), base)
+    elif kind == "today":
+        d = today
+    elif kind == "tomorrow":
+        d = today + timedelta(days=1)
+    elif kind == "dayafter":
+        d = today + timedelta(days=2)
+    elif kind == "nextweek":
+        next_monday = today + timedelta(days=7 - today.weekday())
+        d = next_monday + timedelta(days=_WEEKDAYS.index(m.group("nw_wd")))
+    elif kind == "weekend":
+        saturday = today + timedelta(days=5 - today.weekday())
+        sunday = today + timedelta(days=6 - today.weekday())
+        return max(saturday, today), sunday
+    elif kind == "thisweek":
+        return today, today + timedelta(days=6 - today.weekday())
+    elif kind == "nextweekall":
+        next_monday = today + timedelta(days=7 - today.weekday())
+        return next_monday, next_monday + timedelta(days=6)
+    elif kind == "day":
+        d = _day_only(int(m.group("dd")), base)
+
+    if d is None:
+        return None
+    return d, d
+
+
+def _range(k1, m1, k2, m2, today: date) -> tuple[date, date] | None:
+    """「A〜B」の (開始日, 終了日)。B は A から先で探す"""
+    start = _resolve(k1, m1, today, today)
+    if start is None:
+        return None
+    end = _resolve(k2, m2, today, start[0])
+    if end is None:
+        return None
+
+    # 「10/14〜10/20」を10/16に聞かれたら、来年ではなく今日を含む今月からの期間
+    early = _resolve(k1, m1, today, today.replace(day=1))
+    if early is not None and early[0] < start[0]:
+        early_end = _resolve(k2, m2, today, early[0])
+        if early_end is not None and early_end[1] >= today:
+            start, end = early, early_end
+
+    return start[0], end[1]
+
+
+def _reversed(r: tuple[date, date]) -> bool:
+    return r[1] < r[0] or r[1] - r[0] > _MAX_RANGE
+
+
+@lru_cache(maxsize=2048)
+def _parse_range(text: str, today: date) -> tuple[date, date] | None:
+    tokens = _tokenize(text)
+    if not tokens:
+        return None
+
+    for i in range(len(tokens) - 1):
+        (k1, m1), (k2, m2) = tokens[i], tokens[i + 1]
+        if k1 == "sep" or k1 == "span":
+            continue
+
+        # 「A N日間」「AからN日間」: A から N日分
+        if k2 == "sep" and i + 2 < len(tokens) and tokens[i + 2][0] == "span":
+            k2, m2 = tokens[i + 2]
+        if k2 == "span":
+            start = _resolve(k1, m1, today, today)
+            n = int(m2.group("sp_n"))
+            if start is None or n < 1:
+                return None
+            return start[0], start[0] + timedelta(days=n - 1)
+
+        # 「A〜B」「AからB」
+        if k2 != "sep" or i + 2 >= len(tokens):
+            continue
+        k2, m2 = tokens[i + 2]
+        if k2 in ("sep", "span") or (k2 == "day" and k1 not in _CALENDAR):
+            continue
+        r = _range(k1, m1, k2, m2, today)
+        if r is not None and not _reversed(r):
+            return r
+        # 逆順（「10/20〜10/14」「明日〜今日」）は入れ替えて読む
+        r = _range(k2, m2, k1, m1, today)
+        if r is None or _reversed(r):
+            return None
+        return r
+
+    # 単独の表現は優先度順（同じ種類なら先に出たもの）
+    best = None
+    for k, m in tokens:
+        rank = _PRIORITY.get(k)
+        if rank is not None and (best is None or rank < best[0]):
+            best = (rank, k, m)
+    if best is None:
+        return None
+    return _resolve(best[1], best[2], today, today)
+
+
+def parse_date_range_jp(text: str, today: date | None = None) -> tuple[date, date] | None:
+    """
+    対応：
+      - '2月14日'（最優先） / '2/14' or '2-14' / '14日'（今月。過去なら翌月）
+      - '今日', '明日', '明後日', '来週水曜日'
+      - '今週末'（土〜日）, '今週'（今日〜日曜）, '来週'（月〜日）
+      - '2/14〜2/16', '2月14日から16日'（範囲）
+      - '今日から3日間', '2/14 3日間'（開始日から N日分）
+      - 全角数字（'２／１４'）
+    戻り値: (開始日, 終了日)。単日なら同じ日。読めなければNone
+    """
+    if today is None:
+        today = date.today()
+    return _parse_range(text or "", today)
+
+
+def parse_date_jp(text: str, today: date | None = None) -> date | None:
+    """単日として読む（範囲なら開始日）"""
+    r = parse_date_range_jp(text, today)
+    return r[0] if r else None
@@ -0,0 +1,188 @@
+"""
+LINE Messaging API（v3）のクライアントをプロセスで共有する
+
+同期版は ApiClient を1つだけ作り、urllib3 の keep-alive プールを使い回す。
+非同期版（AsyncMessagingApi）は async with で使い、その中の送信で aiohttp の接続を使い回す。
+どちらも「新規接続 / 再利用」の回数を pool_stats() で確認できる。
+"""
+import asyncio
+import concurrent.futures
+import contextlib
+import os
+import threading
+import time
+import traceback
+
+import aiohttp
+from linebot.v3.messaging import (
+    ApiClient,
+    AsyncApiClient,
+    AsyncMessagingApi,
+    Configuration,
+    MessagingApi,
+)
+
+LINE_CHANNEL_ACCESS_TOKEN = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN", "")
+# 同時に張るHTTPS接続の上限（Webhookのワーカー数や送信の並列数に合わせる）
+LINE_POOL_SIZE = int(os.environ.get("LINE_POOL_SIZE", "10"))
+
+_lock = threading.Lock()
+_api_client = None
+_messaging_api = None
+_async_stats = {"requests": 0, "new_connections": 0, "reused_connections": 0}
+_loop = None
+_loop_api = None
+_pending = set()  # call_async で送信中の Future（close_async で待つ）
+
+
+def _configuration() -> Configuration:
+    if not LINE_CHANNEL_ACCESS_TOKEN:
+        raise RuntimeError("LINE_CHANNEL_ACCESS_TOKEN が未設定です")
+    config = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN)
+    config.connection_pool_maxsize = LINE_POOL_SIZE
+    return config
+
+
+def get_messaging_api() -> MessagingApi:
+    """同期版（スレッドから共有して使ってよい）"""
+    global _api_client, _messaging_api
+    with _lock:
+        if _messaging_api is None:
+            _api_client = ApiClient(_configuration())
+            _messaging_api = MessagingApi(_api_client)
+        return _messaging_api
+
+
+# ==========
+# 非同期版
+# ==========
+async def _on_request_start(session, ctx, params):
+    _async_stats["requests"] += 1
+
+
+async def _on_connection_create(session, ctx, params):
+    _async_stats["new_connections"] += 1
+
+
+async def _on_connection_reuse(session, ctx, params):
+    _async_stats["reused_connections"] += 1
+
+
+@contextlib.asynccontextmanager
+async def async_messaging_api():
+    """
+    使い方:
+        async with async_messaging_api() as api:
+            await asyncio.gather(*(api.push_message(...) for ...))
+    イベントループの中で作る必要があるので、ループごとに1つ作って使い回す。
+    """
+    client = AsyncApiClient(_configuration())
+
+    # 接続の作成/再利用を数えるため、同じコネクタでトレース付きのセッションに差し替える
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(_on_request_start)
+    trace.on_connection_create_end.append(_on_connection_create)
+    trace.on_connection_reuseconn.append(_on_connection_reuse)
+
+    rest = client.rest_client
+    old = rest.pool_manager
+    rest.pool_manager = aiohttp.ClientSession(
+        connector=old.connector,
+        trust_env=True,
+        trace_configs=[trace],
+    )
+    old.detach()
+
+    try:
+        yield AsyncMessagingApi(client)
+    finally:
+        await client.close()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="line-async", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def call_async(fn):
+    """
+    fn(api) が返すコルーチンを、裏のイベントループ上の共有 AsyncMessagingApi で実行する。
+    同期コード（Webhookのワーカーなど）から送信だけを非同期に任せたいとき用。
+    戻り値: concurrent.futures.Future（失敗は握りつぶさずログに出す）
+    """
+    async def run():
+        global _loop_api
+        if _loop_api is None:
+            cm = async_messaging_api()
+            _loop_api = (cm, await cm.__aenter__())
+        return await fn(_loop_api[1])
+
+    future = asyncio.run_coroutine_threadsafe(run(), _background_loop())
+    with _lock:
+        _pending.add(future)
+
+    def done(f):
+        with _lock:
+            _pending.discard(f)
+        if not f.cancelled() and f.exception() is not None:
+            traceback.print_exception(f.exception())
+
+    future.add_done_callback(done)
+    return future
+
+
+def close_async(timeout: float = 10.0):
+    """
+    送信中の call_async が終わるのを待ってから（最大timeout秒）、
+    裏のループの AsyncMessagingApi を閉じる（終了時用）
+    """
+    global _loop_api
+    if _loop is None:
+        return
+    deadline = time.monotonic() + timeout
+    with _lock:
+        pending = list(_pending)
+    if pending:
+        _, not_done = concurrent.futures.wait(pending, timeout=timeout)
+        if not_done:
+            print(f"close_async: {len(not_done)} 件の送信が終わらないまま閉じます")
+
+    if _loop_api is None:
+        return
+    cm = _loop_api[0]
+    _loop_api = None
+    try:
+        asyncio.run_coroutine_threadsafe(cm.__aexit__(None, None, None), _loop).result(
+            max(0.0, deadline - time.monotonic())
+        )
+    except concurrent.futures.TimeoutError:
+        print("close_async: セッションを閉じ終わる前に時間切れ")
+
+
+# ==========
+# メトリクス
+# ==========
+def pool_stats() -> dict:
+    """
+    接続の再利用状況。requests に対して connections が少ないほど使い回せている。
+    """
+    sync = {"requests": 0, "connections": 0}
+    with _lock:
+        client = _api_client
+    if client is not None:
+        pools = client.rest_client.pool_manager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            sync["requests"] += pool.num_requests
+            sync["connections"] += pool.num_connections
+
+    a = dict(_async_stats)
+    return {
+        "sync": dict(sync, reused=max(0, sync["requests"] - sync["connections"])),
+        "async": a,
+    }
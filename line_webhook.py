@@ -2,20 +2,29 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-import re
+import atexit
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
 load_dotenv()
 
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta
 
-from flask import Flask, request, abort
+from flask import Flask, Response, request, abort, jsonify
 
-from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
-from linebot.models import MessageEvent, TextMessage, TextSendMessage
+from linebot.v3 import WebhookHandler
+from linebot.v3.exceptions import InvalidSignatureError
+from linebot.v3.messaging import ReplyMessageRequest, TextMessage
+from linebot.v3.webhooks import MessageEvent, TextMessageContent
 
-# 既存DB（Google Sheets）をそのまま利用
-from sheets_db import list_todos
+# 既存DB（既定はGoogle Sheets。TODO_BACKENDで切り替え）
+from todo_store import add_change_listener, data_version, get_todo_fields, store_stats
+from due_index import archived_between, get_due_index, merge_days, parse_due_date
+from jp_date import parse_date_range_jp
+from work_queue import WorkQueue
+from line_client import call_async, close_async, get_messaging_api, pool_stats
+from metrics import count, render_prometheus, timed
 
 # ==========
 # 環境変数
@@ -28,139 +37,131 @@ if not LINE_CHANNEL_ACCESS_TOKEN or not LINE_CHANNEL_SECRET:
         "LINE_CHANNEL_ACCESS_TOKEN / LINE_CHANNEL_SECRET が未設定です。"
     )
 
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
-handler = WebhookHandler(LINE_CHANNEL_SECRET)
-
-app = Flask(__name__)
-
-# ==========
-# 日付パース（日本語：2月14日派 最優先）
-# ==========
-def parse_date_jp(text: str, today: date | None = None) -> date | None:
-    """
-    対応（MVP）：
-      - '2月14日'（最優先）
-      - '2/14' or '2-14'
-      - '今日', '明日'
-      - '14日'（今月。過去なら翌月）
-    """
-    if today is None:
-        today = date.today()
+# 1にすると署名確認だけして即200を返し、イベントはワーカーで処理する
+WEBHOOK_ASYNC = os.environ.get("WEBHOOK_ASYNC", "") == "1"
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get("WEBHOOK_QUEUE_SIZE", "100"))
+# 同じ日付の返信を使い回す秒数と件数（0で無効）
+REPLY_CACHE_TTL = float(os.environ.get("REPLY_CACHE_TTL", "30"))
+REPLY_CACHE_SIZE = int(os.environ.get("REPLY_CACHE_SIZE", "64"))
 
-    t = (text or "").strip()
-
-    # 1) 「2月14日」
-    m = re.search(r"(\d{1,2})\s*月\s*(\d{1,2})\s*日", t)
-    if m:
-        month = int(m.group(1))
-        day = int(m.group(2))
-        y = today.year
-        try:
-            d = date(y, month, day)
-        except ValueError:
-            return None
-        # 過去なら来年にスライド（自然な挙動）
-        if d < today:
-            try:
-                d = date(y + 1, month, day)
-            except ValueError:
-                return None
-        return d
-
-    # 2) 「2/14」「2-14」
-    m = re.search(r"(\d{1,2})\s*[\/\-]\s*(\d{1,2})", t)
-    if m:
-        month = int(m.group(1))
-        day = int(m.group(2))
-        y = today.year
-        try:
-            d = date(y, month, day)
-        except ValueError:
-            return None
-        if d < today:
-            try:
-                d = date(y + 1, month, day)
-            except ValueError:
-                return None
-        return d
-
-    # 3) 今日/明日
-    if re.search(r"(今日|きょう)", t):
-        return today
-    if re.search(r"(明日|あした)", t):
-        return today + timedelta(days=1)
-
-    # 4) 「14日」だけ（今月。過去なら翌月）
-    m = re.search(r"(\d{1,2})\s*日", t)
-    if m:
-        day = int(m.group(1))
-        y = today.year
-        month = today.month
-        try:
-            d = date(y, month, day)
-        except ValueError:
-            return None
-        if d < today:
-            # 翌月へ
-            month2 = 1 if month == 12 else month + 1
-            y2 = y + 1 if month == 12 else y
-            try:
-                d = date(y2, month2, day)
-            except ValueError:
-                return None
-        return d
+# LINEの制限：1回の返信は5吹き出しまで、1吹き出し5000文字まで
+MAX_REPLY_BUBBLES = 5
+MAX_BUBBLE_CHARS = 5000
 
-    return None
+# 「期限切れ」系の問い合わせ
+OVERDUE_WORDS = ("期限切れ", "期限過ぎ", "過ぎてる")
 
+handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
-def _normalize_due_date_str(s: str) -> str:
-    """
-    Sheetsのdue_date文字列を 'YYYY-MM-DD' に寄せる（壊れてても落ちにくい）
-    """
-    if not s:
-        return ""
-    s = str(s).strip()
-    # すでにYYYY-MM-DDならそのまま
-    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", s):
-        return s
-    # Streamlit date_input の str(date) は YYYY-MM-DD なので基本ここは通らない想定
-    # 念のため datetime 変換
-    try:
-        d = datetime.fromisoformat(s).date()
-        return d.strftime("%Y-%m-%d")
-    except Exception:
-        return ""
+work_queue = None
+if WEBHOOK_ASYNC:
+    work_queue = WorkQueue(workers=WEBHOOK_WORKERS, maxsize=WEBHOOK_QUEUE_SIZE, name="webhook")
+    # 終了時は、積まれているイベントを処理し終え（shutdown）、送信中の返信（call_async）が
+    # 終わるのを待ってからセッションを閉じる（close_async）。atexitは登録の逆順に呼ばれる
+    atexit.register(close_async)
+    atexit.register(work_queue.shutdown)
 
+app = Flask(__name__)
 
-def _priority_num(p: str) -> int:
-    # 既存priorityが無い/空でもOK
-    order = {"High": 3, "Medium": 2, "Low": 1}
-    return order.get(str(p), 0)
+# 一覧に出す列（bodyは一致した行の分だけ後から読む）
+INDEX_COLUMNS = ["id", "title", "due_date", "priority"]
 
 
+@timed("webhook.fetch")
 def fetch_tasks_by_date(target: date):
     """
-    Sheetsから全件取得→target日付で絞り込み
+    日付索引（データが変わるまで使い回し）からtarget日のタスクを引く→一致した行のbodyだけ追加取得
     """
-    rows = list_todos()  # list of dict
-    target_str = target.strftime("%Y-%m-%d")
-
-    tasks = []
-    for r in rows:
-        due = _normalize_due_date_str(r.get("due_date", ""))
-        if due == target_str:
-            tasks.append(r)
-
-    # priority desc → title asc（好みで変更可）
-    tasks.sort(
-        key=lambda x: (
-            -_priority_num(x.get("priority", "")),
-            str(x.get("title", "")),
-        )
-    )
+    tasks = get_due_index(INDEX_COLUMNS).on(target)  # priority desc → title asc 済み
+    # 古い日付ならその月のアーカイブも見る（アーカイブ分はbodyも一緒に読む）
+    archived = archived_between(target, target, INDEX_COLUMNS + ["body"])
+    if archived:
+        tasks = merge_days([(target, tasks)], archived)[0][1]
+
+    # 長いbodyは一致した行の分だけ読む
+    bodies = get_todo_fields([t["id"] for t in tasks if t.get("id") and "body" not in t], ["body"])
+    for t in tasks:
+        if "body" not in t:
+            t["body"] = bodies.get(t.get("id"), {}).get("body", "")
     return tasks
 
 
+# ==========
+# 返信キャッシュ（日付ごと。LRU＋短いTTL）
+# ==========
+class ReplyCache:
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._items = OrderedDict()  # 日付 → (data_version, 期限, 返信)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, target: date, version):
+        with self._lock:
+            item = self._items.get(target)
+            if item is None or item[0] != version or item[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._items.move_to_end(target)
+            self.hits += 1
+            return item[2]
+
+    def put(self, target: date, version, reply: str):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[target] = (version, time.monotonic() + self.ttl, reply)
+            self._items.move_to_end(target)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, due_dates=None, before=None, after=None):
+        """
+        due_dates（Sheetsの値の集合）に当たる日付だけ捨てる。Noneなら全部。
+        残りのうち before 時点の返信は after でも正しいので付け替える。
+        """
+        with self._lock:
+            if due_dates is None:
+                self._items.clear()
+                return
+            for v in due_dates:
+                d = parse_due_date(v)
+                if d is not None:
+                    self._items.pop(d, None)
+            if before is None:
+                return
+            for k, (version, expires, reply) in self._items.items():
+                if version == before:
+                    self._items[k] = (after, expires, reply)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._items)}
+
+
+reply_cache = ReplyCache(REPLY_CACHE_TTL, REPLY_CACHE_SIZE)
+# 自プロセスの書き込みで、影響した日付の返信を捨てる
+add_change_listener(reply_cache.invalidate)
+
+
+def build_reply_for_date(target: date) -> str:
+    cached = reply_cache.get(target, data_version())
+    if cached is not None:
+        count("reply_cache", result="hit")
+        return cached
+    count("reply_cache", result="miss")
+
+    tasks = fetch_tasks_by_date(target)
+    reply = format_tasks_reply(target, tasks)
+    # 取得中にキャッシュが更新されていることがあるので取得後のバージョンで保存
+    reply_cache.put(target, data_version(), reply)
+    return reply
+
+
+@timed("webhook.format")
 def format_tasks_reply(target: date, tasks: list[dict]) -> str:
     dstr = target.strftime("%-m/%-d") if hasattr(target, "strftime") else str(target)
     # Windows互換が気になるなら %-m/%-d は避ける（Streamlit CloudはLinuxなのでOK）
@@ -184,6 +185,68 @@ def format_tasks_reply(target: date, tasks: list[dict]) -> str:
     return "\n".join(lines)
 
 
+@timed("webhook.fetch")
+def fetch_tasks_between(start: date | None, end: date) -> list[tuple[date, list[dict]]]:
+    """
+    期間のタスクを日付ごとに返す（1つの索引＝1回の取得から二分探索で切り出す）
+    アーカイブ済みの古い期間を含むときだけ、その月のアーカイブも読む
+    """
+    days = get_due_index(INDEX_COLUMNS).between(start, end)
+    archived = archived_between(start, end, INDEX_COLUMNS)
+    return merge_days(days, archived) if archived else days
+
+
+_WEEKDAY_JP = "月火水木金土日"
+
+
+def _md(d: date) -> str:
+    return d.strftime("%m/%d").lstrip("0").replace("/0", "/")
+
+
+@timed("webhook.format")
+def format_range_reply(title: str, days: list[tuple[date, list[dict]]]) -> list[str]:
+    """
+    日付ごとにまとめた返信。長ければ複数の吹き出しに分ける。
+    """
+    total = sum(len(tasks) for _, tasks in days)
+    if total == 0:
+        return [f"{title}\n予定は0件。\n空きだ。筋トレできる。"]
+
+    lines = [f"{title} {total}件"]
+    for d, tasks in days:
+        lines.append(f"■ {_md(d)}({_WEEKDAY_JP[d.weekday()]})")
+        for i, t in enumerate(tasks, start=1):
+            pr = t.get("priority", "")
+            pr_txt = f"({pr}) " if pr else ""
+            name = str(t.get("title", "")).strip() or "（無題）"
+            lines.append(f"{i}) {pr_txt}{name}")
+    return split_bubbles(lines)
+
+
+def split_bubbles(lines: list[str]) -> list[str]:
+    """行単位で吹き出しに詰める。入りきらない分は最後の吹き出しで省略"""
+    bubbles = []
+    cur = []
+    size = 0
+    for n, line in enumerate(lines):
+        line = line[:MAX_BUBBLE_CHARS]
+        if cur and size + 1 + len(line) > MAX_BUBBLE_CHARS:
+            bubbles.append(cur)
+            cur, size = [], 0
+            if len(bubbles) == MAX_REPLY_BUBBLES:
+                # 最後の吹き出しの末尾を「…ほかN行」に置き換える
+                rest = len(lines) - n + 1
+                bubbles[-1][-1] = f"…ほか{rest}行"
+                break
+        cur.append(line)
+        size += len(line) + (1 if size else 0)
+    else:
+        if cur:
+            bubbles.append(cur)
+
+    return ["\n".join(b) for b in bubbles]
+
+
 def build_help_message() -> str:
     return (
         "日付がわからなかった。\n"
@@ -192,10 +255,36 @@ def build_help_message() -> str:
         "・2/14の予定\n"
         "・今日の予定\n"
         "・明日の予定\n"
-        "・14日の予定"
+        "・明後日の予定\n"
+        "・来週水曜日の予定\n"
+        "・14日の予定\n"
+        "・今週の予定\n"
+        "・2/14〜2/20の予定\n"
+        "・期限切れ"
     )
 
 
+def build_replies(text: str, today: date | None = None) -> list[str]:
+    """受け取った文面 → 返信（吹き出しごとの文字列）"""
+    if today is None:
+        today = date.today()
+
+    if any(w in text for w in OVERDUE_WORDS):
+        yesterday = today - timedelta(days=1)
+        return format_range_reply("【期限切れ】", fetch_tasks_between(None, yesterday))
+
+    # 計測は呼び出し側で（パーサ自体は µs 単位なので、中で測ると計測の方が重い）
+    with timed("parse_date_jp"):
+        r = parse_date_range_jp(text, today)
+    if r is None:
+        return [build_help_message()]
+
+    start, end = r
+    if start == end:
+        return [build_reply_for_date(start)]
+    return format_range_reply(f"【{_md(start)}〜{_md(end)}】", fetch_tasks_between(start, end))
+
+
 # ==========
 # LINE Webhook
 # ==========
@@ -204,33 +293,75 @@ def health():
     return "ok", 200
 
 
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({
+        "queue": work_queue.stats() if work_queue else None,
+        "reply_cache": reply_cache.stats(),
+        "line_pool": pool_stats(),
+        "store": store_stats(),
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Prometheus のテキスト形式（処理時間のヒストグラムと回数）
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/callback", methods=["POST"])
 def callback():
     signature = request.headers.get("X-Line-Signature", "")
     body = request.get_data(as_text=True)
 
+    if work_queue is None:
+        try:
+            handler.handle(body, signature)
+        except InvalidSignatureError:
+            abort(400)
+        return "OK", 200
+
     try:
-        handler.handle(body, signature)
+        events = handler.parser.parse(body, signature)
     except InvalidSignatureError:
         abort(400)
 
+    # 1回の配信に複数イベントがあればワーカーで並行に処理される
+    for event in events:
+        if not work_queue.submit(dispatch_event, event):
+            # キューが一杯なら取りこぼさないようにその場で処理
+            dispatch_event(event)
+
     return "OK", 200
 
 
-@handler.add(MessageEvent, message=TextMessage)
+def dispatch_event(event):
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+        handle_message(event)
+
+
+@handler.add(MessageEvent, message=TextMessageContent)
 def handle_message(event):
     text = (event.message.text or "").strip()
     print("USER_ID:", event.source.user_id)
 
-    target = parse_date_jp(text)
-    if target is None:
-        reply = build_help_message()
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=reply))
-        return
+    with timed("webhook.build_replies"):
+        replies = build_replies(text)
+    req = ReplyMessageRequest(
+        reply_token=event.reply_token,
+        messages=[TextMessage(text=r) for r in replies],
+    )
 
-    tasks = fetch_tasks_by_date(target)
-    reply = format_tasks_reply(target, tasks)
-    line_bot_api.reply_message(event.reply_token, TextSendMessage(text=reply))
+    if work_queue is None:
+        with timed("line.reply"):
+            get_messaging_api().reply_message(req)
+    else:
+        # 非同期モードでは送信は裏のイベントループに任せ、ワーカーは次のイベントへ
+        async def reply(api):
+            with timed("line.reply"):
+                await api.reply_message(req)
+
+        call_async(reply)
 
 
 if __name__ == "__main__":
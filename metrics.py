@@ -0,0 +1,168 @@
+"""
+軽量な計測（処理時間のヒストグラム＋回数カウンタ）
+
+  with timed("sheets.read"): ...   # 所要時間と回数（例外なら errors も数える）
+  @timed("parse_date_jp")          # デコレータとしても使える
+  count("line_retries", kind="push")
+
+render_prometheus() が /metrics 用のテキスト、snapshot() / dump_json() が JSON 用。
+1回の記録は perf_counter 2回＋ロック1回なので本番でも付けっぱなしでよい。
+METRICS=0 で記録しない。
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+# ヒストグラムの境界（秒）。Sheets/LINE の往復（数十ms〜数秒）と手元の処理（µs〜ms）の両方を見る
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_ops = {}  # op → [バケットごとの件数..., 合計秒, 件数, エラー数]
+_counters = {}  # (名前, ((ラベル, 値), ...)) → 回数
+
+
+def observe(op: str, seconds: float, error: bool = False):
+    if not METRICS_ENABLED:
+        return
+    i = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        rec = _ops.get(op)
+        if rec is None:
+            rec = _ops[op] = [0] * (len(BUCKETS) + 1) + [0.0, 0, 0]
+        rec[i] += 1
+        rec[-3] += seconds
+        rec[-2] += 1
+        if error:
+            rec[-1] += 1
+
+
+def count(name: str, n: int = 1, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+class timed:
+    """with timed(op): ... / @timed(op)"""
+
+    __slots__ = ("op", "_t0")
+
+    def __init__(self, op: str):
+        self.op = op
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.op, time.perf_counter() - self._t0, error=exc_type is not None)
+        return False
+
+    def __call__(self, fn):
+        op = self.op
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                observe(op, time.perf_counter() - t0, error=not ok)
+
+        return wrapper
+
+
+def reset():
+    """記録を消す（ベンチマークやテスト用）"""
+    with _lock:
+        _ops.clear()
+        _counters.clear()
+
+
+def snapshot() -> dict:
+    """{"ops": {op: {count, sum_s, avg_ms, errors, buckets}}, "counters": {名前{ラベル}: 回数}}"""
+    with _lock:
+        ops = {op: list(rec) for op, rec in _ops.items()}
+        counters = dict(_counters)
+
+    out_ops = {}
+    for op, rec in sorted(ops.items()):
+        n = rec[-2]
+        out_ops[op] = {
+            "count": n,
+            "sum_s": round(rec[-3], 6),
+            "avg_ms": round(rec[-3] / n * 1000, 3) if n else 0.0,
+            "errors": rec[-1],
+            # 「le 秒以下」の累積件数（Prometheusと同じ形）
+            "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], _cumulative(rec))),
+        }
+    return {
+        "ops": out_ops,
+        "counters": {_series(name, labels): v for (name, labels), v in sorted(counters.items())},
+    }
+
+
+def dump_json(path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, ensure_ascii=False, indent=2)
+
+
+def _cumulative(rec):
+    out, total = [], 0
+    for c in rec[:len(BUCKETS) + 1]:
+        total += c
+        out.append(total)
+    return out
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _series(name: str, labels) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def render_prometheus(prefix: str = "todo") -> str:
+    """Prometheus のテキスト形式（text/plain; version=0.0.4）"""
+    with _lock:
+        ops = {op: list(rec) for op, rec in _ops.items()}
+        counters = dict(_counters)
+
+    lines = []
+    if ops:
+        h = f"{prefix}_op_duration_seconds"
+        lines.append(f"# HELP {h} Duration of instrumented operations.")
+        lines.append(f"# TYPE {h} histogram")
+        for op, rec in sorted(ops.items()):
+            for le, c in zip([str(b) for b in BUCKETS] + ["+Inf"], _cumulative(rec)):
+                lines.append(f'{h}_bucket{{op="{_escape(op)}",le="{le}"}} {c}')
+            lines.append(f'{h}_sum{{op="{_escape(op)}"}} {rec[-3]:.6f}')
+            lines.append(f'{h}_count{{op="{_escape(op)}"}} {rec[-2]}')
+
+        e = f"{prefix}_op_errors_total"
+        lines.append(f"# HELP {e} Instrumented operations that raised.")
+        lines.append(f"# TYPE {e} counter")
+        for op, rec in sorted(ops.items()):
+            lines.append(f'{e}{{op="{_escape(op)}"}} {rec[-1]}')
+
+    seen = set()
+    for (name, labels), v in sorted(counters.items()):
+        full = f"{prefix}_{name}_total"
+        if full not in seen:
+            seen.add(full)
+            lines.append(f"# TYPE {full} counter")
+        lines.append(f"{_series(full, labels)} {v}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,95 @@
+"""
+トークンバケット（スレッド間で共有するレート制限）
+FileTokenBucket はファイルロックで複数プロセス間でも共有する
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        """
+        rate: 1秒あたりに補充するトークン数
+        capacity: 貯められる上限（バースト）。省略時は rate と同じ
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_take(self, n: float) -> float:
+        """取れたら0、足りなければ貯まるまでの秒数"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= n:
+                self._tokens -= n
+                return 0.0
+            return (n - self._tokens) / self.rate
+
+    def acquire(self, n: float = 1.0) -> float:
+        """
+        トークンが貯まるまで待って取る。戻り値: 待った秒数
+        """
+        waited = 0.0
+        while True:
+            wait = self._try_take(n)
+            if wait == 0.0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, n: float = 1.0) -> float:
+        """acquire() のイベントループ版（待つ間ループを止めない）"""
+        waited = 0.0
+        while True:
+            wait = self._try_take(n)
+            if wait == 0.0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    状態（残りトークン, 更新時刻）をファイルに置き、flock で排他して複数プロセスで共有する。
+    Streamlit / Webhook / cron が同じサービスアカウントのクォータを使うとき用（POSIXのみ）。
+    """
+
+    def __init__(self, path: str, rate: float, capacity: float | None = None):
+        super().__init__(rate, capacity)
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _try_take(self, n: float) -> float:
+        import fcntl
+
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            now = time.time()
+            try:
+                tokens, updated = json.loads(f.read())
+            except ValueError:
+                tokens, updated = self.capacity, now
+
+            # 時計が戻った場合は補充しない
+            tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+            if tokens >= n:
+                tokens -= n
+                wait = 0.0
+            else:
+                wait = (n - tokens) / self.rate
+
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps([tokens, now]))
+            f.flush()
+        return wait
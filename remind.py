@@ -1,94 +1,97 @@
+import asyncio
 import os
-import re
-from datetime import date, timedelta, datetime
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from linebot import LineBotApi
-from linebot.models import TextSendMessage
-
-from sheets_db import list_todos
+import aiohttp
+import urllib3
+from linebot.v3.messaging import (
+    ApiException,
+    MulticastRequest,
+    PushMessageRequest,
+    TextMessage,
+)
+
+from due_index import DueIndex
+from line_client import async_messaging_api, get_messaging_api, pool_stats
+from metrics import count, dump_json, timed
+from rate_limit import TokenBucket
+from todo_store import snapshot
 
 # ==========
 # 環境変数
 # ==========
 LINE_CHANNEL_ACCESS_TOKEN = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN", "")
 LINE_USER_ID = os.environ.get("LINE_USER_ID", "")
+# 複数人に送る場合: "Uxxxx=alice,Uyyyy=bob,Uzzzz"
+#   =owner を付けるとその人の担当タスク＋チーム分、付けなければチーム分（owner空）だけ
+#   =* は全タスク。LINE_RECIPIENTS が無ければ LINE_USER_ID に全タスクを送る（従来どおり）
+LINE_RECIPIENTS = os.environ.get("LINE_RECIPIENTS", "")
+
+# 送信の並列数とレート（1秒あたりのAPI呼び出し数）
+REMIND_PUSH_WORKERS = int(os.environ.get("REMIND_PUSH_WORKERS", "8"))
+REMIND_PUSH_RATE = float(os.environ.get("REMIND_PUSH_RATE", "20"))
+# 1にするとスレッドではなく AsyncMessagingApi（1本のイベントループ）で並列に送る
+REMIND_ASYNC = os.environ.get("REMIND_ASYNC", "") == "1"
+# LINEの制限：multicastは1回500人まで、テキストは5000文字まで
+MULTICAST_MAX = 500
+MAX_TEXT_CHARS = 5000
+# 429/5xx の再試行回数
+SEND_RETRIES = 4
+# 指定すると実行後に計測結果（処理時間・回数）をこのパスへJSONで書き出す
+REMIND_METRICS_JSON = os.environ.get("REMIND_METRICS_JSON", "")
 
 if not LINE_CHANNEL_ACCESS_TOKEN:
     raise RuntimeError("LINE_CHANNEL_ACCESS_TOKEN が未設定です")
-if not LINE_USER_ID:
-    raise RuntimeError("LINE_USER_ID が未設定です（Push通知先）")
-
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+if not LINE_USER_ID and not LINE_RECIPIENTS:
+    raise RuntimeError("LINE_USER_ID / LINE_RECIPIENTS が未設定です（Push通知先）")
 
 
 # ==========
-# 日付正規化（表記ゆれに強い）
+# ダイジェスト設定
 # ==========
-def _normalize_due_date_str(s: str) -> str:
-    if s is None:
-        return ""
-    s = str(s).strip()
-    if not s:
-        return ""
-
-    # 2026/2/12 → 2026-2-12
-    s = s.replace("/", "-")
-
-    # YYYY-MM-DD（1桁月日も許容）
-    m = re.fullmatch(r"(\d{4})-(\d{1,2})-(\d{1,2})", s)
-    if m:
-        y, mo, da = int(m.group(1)), int(m.group(2)), int(m.group(3))
-        try:
-            return date(y, mo, da).strftime("%Y-%m-%d")
-        except ValueError:
-            return ""
-
-    # 2026-02-12 00:00:00 や ISO形式
-    try:
-        s2 = s.replace(" ", "T")
-        d = datetime.fromisoformat(s2).date()
-        return d.strftime("%Y-%m-%d")
-    except Exception:
-        return ""
-
-    return ""
-
-
-def _priority_num(p: str) -> int:
-    order = {"High": 3, "Medium": 2, "Low": 1}
-    return order.get(str(p), 0)
+# 通知にbodyは使わないので必要な列だけ取る
+INDEX_COLUMNS = ["title", "due_date", "priority", "owner"]
+
+# 並べたい順に: overdue(期限切れ) / today / tomorrow / week(明後日〜日曜)
+REMIND_SECTIONS = [
+    s.strip()
+    for s in (os.environ.get("REMIND_SECTIONS") or "today,tomorrow").split(",")
+    if s.strip()
+]
+
+
+def section_window(name: str, today: date):
+    """
+    セクション名 → (ラベル, 開始日, 終了日)。開始日Noneは「それ以前すべて」。
+    """
+    if name == "overdue":
+        return "期限切れ", None, today - timedelta(days=1)
+    if name == "today":
+        return "今日", today, today
+    if name == "tomorrow":
+        return "明日", today + timedelta(days=1), today + timedelta(days=1)
+    if name == "week":
+        # 今日/明日は別セクションなので明後日から今週の日曜まで
+        return "今週", today + timedelta(days=2), today + timedelta(days=6 - today.weekday())
+    raise ValueError(f"unknown remind section: {name}")
 
 
 # ==========
-# 指定日のタスク取得
+# メッセージ整形
 # ==========
-def fetch_tasks_for_day(target: date):
-    rows = list_todos()
-    target_str = target.strftime("%Y-%m-%d")
+def _md(d: date) -> str:
+    return d.strftime("%m/%d").lstrip("0").replace("/0", "/")
 
-    tasks = []
-    for r in rows:
-        due = _normalize_due_date_str(r.get("due_date", ""))
-        if due == target_str:
-            tasks.append(r)
 
-    tasks.sort(
-        key=lambda x: (
-            -_priority_num(x.get("priority", "")),
-            str(x.get("title", "")),
-        )
-    )
-    return tasks
-
-
-# ==========
-# メッセージ整形
-# ==========
 def format_remind_message(target: date, tasks: list[dict], label: str) -> str:
-    dstr = target.strftime("%m/%d").lstrip("0").replace("/0", "/")
+    dstr = _md(target)
 
     if not tasks:
         return f"【{label} {dstr}】締切タスクは0件。"
@@ -103,30 +106,245 @@ def format_remind_message(target: date, tasks: list[dict], label: str) -> str:
     return "\n".join(lines)
 
 
+def format_range_message(label: str, start: date | None, end: date, days: list[tuple[date, list[dict]]]) -> str:
+    span = f"〜{_md(end)}" if start is None else f"{_md(start)}〜{_md(end)}"
+    total = sum(len(tasks) for _, tasks in days)
+
+    if total == 0:
+        return f"【{label} {span}】締切タスクは0件。"
+
+    lines = [f"【{label} {span}】{total}件"]
+    for d, tasks in days:
+        lines.append(f"■ {_md(d)}")
+        for i, t in enumerate(tasks, start=1):
+            pr = t.get("priority", "")
+            pr_txt = f"({pr}) " if pr else ""
+            title = str(t.get("title", "")).strip() or "（無題）"
+            lines.append(f"{i}) {pr_txt}{title}")
+
+    return "\n".join(lines)
+
+
+def build_digest(index, today: date, sections: list[str] | None = None) -> str:
+    """
+    1つの索引（＝1回の取得）から全セクションを組み立てる。
+    """
+    parts = []
+    for name in sections or REMIND_SECTIONS:
+        label, start, end = section_window(name, today)
+        if start is None:
+            parts.append(format_range_message(label, None, end, index.before(end)))
+        elif start == end:
+            parts.append(format_remind_message(start, index.on(start), label))
+        elif start < end:
+            parts.append(format_range_message(label, start, end, index.between(start, end)))
+        # start > end（週末で「今週」の残りが無い）は出さない
+
+    return "\n\n".join(parts)
+
+
 # ==========
-# Push送信
+# 宛先ごとのメッセージ
 # ==========
-def push(text: str):
-    line_bot_api.push_message(
-        LINE_USER_ID,
-        TextSendMessage(text=text)
-    )
+def parse_recipients(spec: str, fallback_user_id: str = "") -> list[tuple[str, str]]:
+    """ "U1=alice,U2" → [("U1", "alice"), ("U2", "")] """
+    out = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        user_id, _, owner = item.partition("=")
+        out.append((user_id.strip(), owner.strip()))
+    if not out and fallback_user_id:
+        out.append((fallback_user_id, "*"))
+    return out
+
+
+def build_messages(rows: list[dict], today: date, recipients: list[tuple[str, str]]) -> dict[str, list[str]]:
+    """
+    1回の取得結果から宛先ごとの本文を作り、同じ本文の宛先をまとめる。
+    戻り値: {本文: [user_id, ...]}
+    """
+    by_owner: dict[str, list[dict]] = {}
+    for r in rows:
+        by_owner.setdefault(str(r.get("owner", "")).strip(), []).append(r)
+
+    digests = {}
+
+    def digest(owner: str) -> str:
+        if owner not in digests:
+            target = rows if owner == "*" else by_owner.get(owner, [])
+            digests[owner] = build_digest(DueIndex(target), today)
+        return digests[owner]
+
+    groups: dict[str, list[str]] = {}
+    for user_id, owner in recipients:
+        if owner and owner != "*":
+            text = f"＜{owner}さんの担当＞\n{digest(owner)}\n\n＜チーム＞\n{digest('')}"
+        else:
+            text = digest(owner)
+        if len(text) > MAX_TEXT_CHARS:
+            text = text[:MAX_TEXT_CHARS - 1] + "…"
+        groups.setdefault(text, []).append(user_id)
+    return groups
+
+
+# ==========
+# 送信（multicastでまとめる＋並列push、レート制限と再試行つき）
+# ==========
+def _request(kind: str, to, text: str):
+    messages = [TextMessage(text=text)]
+    if kind == "multicast":
+        return MulticastRequest(to=to, messages=messages)
+    return PushMessageRequest(to=to, messages=messages)
+
+
+def _should_retry(e: Exception, attempt: int) -> bool:
+    """
+    True: 待って再試行 / False: 成功扱い（409） / 再試行しないものは raise
+    """
+    if isinstance(e, ApiException):
+        if e.status == 409:
+            # 同じ retry_key の送信は受付済み
+            return False
+        if not (e.status == 429 or e.status >= 500):
+            raise e
+    if attempt == SEND_RETRIES:
+        raise e
+    return True
+
+
+def _backoff(attempt: int) -> float:
+    # 指数バックオフ（ジッターつき）
+    return min(30.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def _send(kind: str, to, text: str, bucket: TokenBucket):
+    api = get_messaging_api()
+    req = _request(kind, to, text)
+    # 再試行しても二重送信にならないよう、同じ送信には同じ retry_key を使う
+    retry_key = str(uuid.uuid4())
+
+    for attempt in range(SEND_RETRIES + 1):
+        bucket.acquire()
+        try:
+            with timed(f"line.{kind}"):
+                if kind == "multicast":
+                    api.multicast(req, x_line_retry_key=retry_key)
+                else:
+                    api.push_message(req, x_line_retry_key=retry_key)
+            return
+        except (ApiException, urllib3.exceptions.HTTPError) as e:
+            if not _should_retry(e, attempt):
+                return
+        count("line_retries", kind=kind)
+        time.sleep(_backoff(attempt))
+
+
+async def _send_async(api, kind: str, to, text: str, bucket: TokenBucket):
+    req = _request(kind, to, text)
+    retry_key = str(uuid.uuid4())
+
+    for attempt in range(SEND_RETRIES + 1):
+        await bucket.acquire_async()
+        try:
+            with timed(f"line.{kind}"):
+                if kind == "multicast":
+                    await api.multicast(req, x_line_retry_key=retry_key)
+                else:
+                    await api.push_message(req, x_line_retry_key=retry_key)
+            return
+        except (ApiException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not _should_retry(e, attempt):
+                return
+        count("line_retries", kind=kind)
+        await asyncio.sleep(_backoff(attempt))
+
+
+def _build_jobs(groups: dict[str, list[str]]) -> list[tuple]:
+    """同じ本文が2人以上なら multicast（500人ずつ）、1人なら push"""
+    jobs = []
+    for text, user_ids in groups.items():
+        if len(user_ids) == 1:
+            jobs.append(("push", user_ids[0], text))
+            continue
+        for i in range(0, len(user_ids), MULTICAST_MAX):
+            jobs.append(("multicast", user_ids[i:i + MULTICAST_MAX], text))
+    return jobs
+
+
+def _report(jobs: list, failed: list) -> dict:
+    for (kind, to, _), e in failed:
+        print(f"send failed ({kind} {to}): {e}")
+    return {"requests": len(jobs), "failed": len(failed)}
+
+
+def send_all(groups: dict[str, list[str]]) -> dict:
+    """
+    すべてワーカーで並列に送り、API呼び出しはトークンバケットで絞る。
+    接続は共有の MessagingApi のプールを使い回す。
+    """
+    jobs = _build_jobs(groups)
+    bucket = TokenBucket(REMIND_PUSH_RATE)
+    failed = []
+    with ThreadPoolExecutor(max_workers=REMIND_PUSH_WORKERS) as pool:
+        futures = [(job, pool.submit(_send, *job, bucket)) for job in jobs]
+        for job, f in futures:
+            try:
+                f.result()
+            except Exception as e:
+                failed.append((job, e))
+
+    return _report(jobs, failed)
+
+
+async def send_all_async(groups: dict[str, list[str]]) -> dict:
+    """send_all() の AsyncMessagingApi 版。並列数は REMIND_PUSH_WORKERS まで"""
+    jobs = _build_jobs(groups)
+    bucket = TokenBucket(REMIND_PUSH_RATE)
+    sem = asyncio.Semaphore(REMIND_PUSH_WORKERS)
+
+    async with async_messaging_api() as api:
+        async def run(job):
+            async with sem:
+                await _send_async(api, *job, bucket)
+
+        results = await asyncio.gather(*(run(job) for job in jobs), return_exceptions=True)
+
+    failed = [(job, r) for job, r in zip(jobs, results) if isinstance(r, Exception)]
+    return _report(jobs, failed)
 
 
 # ==========
 # 実行
 # ==========
 def main():
-    today = date.today()
-    tomorrow = today + timedelta(days=1)
-
-    today_tasks = fetch_tasks_for_day(today)
-    tomorrow_tasks = fetch_tasks_for_day(tomorrow)
+    try:
+        _run()
+    finally:
+        if REMIND_METRICS_JSON:
+            dump_json(REMIND_METRICS_JSON)
 
-    msg_today = format_remind_message(today, today_tasks, "今日")
-    msg_tomorrow = format_remind_message(tomorrow, tomorrow_tasks, "明日")
 
-    push(msg_today + "\n\n" + msg_tomorrow)
+def _run():
+    today = date.today()
+    recipients = parse_recipients(LINE_RECIPIENTS, LINE_USER_ID)
+
+    # Sheetsの読み取りは宛先やセクションの数に関係なく1回
+    with timed("remind.fetch"):
+        _, rows = snapshot(INDEX_COLUMNS)
+    with timed("remind.format"):
+        groups = build_messages(rows, today, recipients)
+
+    with timed("remind.send"):
+        if REMIND_ASYNC:
+            result = asyncio.run(send_all_async(groups))
+        else:
+            result = send_all(groups)
+    print(f"recipients: {len(recipients)}, requests: {result['requests']}, failed: {result['failed']}")
+    print(f"line pool: {pool_stats()}")
+    if result["failed"]:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
@@ -1,21 +1,65 @@
 import os
+import bisect
 import json
-from datetime import datetime
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
 import uuid
 
+import atexit
+import traceback
+
 import gspread
+import requests
+from google.auth.exceptions import RefreshError, TransportError
+from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+
+from metrics import timed
+from sheets_gate import QuotaHTTPClient, gate_stats
+from sheets_journal import Journal, coalesce
+from todo_schema import EDITABLE_FIELDS, HEADERS, parse_due_date
 
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
 ]
 
-SHEET_URL = os.environ["SHEET_URL"]
+# 接続するときに確認する（importだけなら未設定でもよい）
+SHEET_URL = os.environ.get("SHEET_URL", "")
 WORKSHEET_NAME = os.getenv("WORKSHEET_NAME", "todos")
 
-# 新スキーマ（priority追加）
-HEADERS = ["id", "title", "body", "due_date", "priority", "created_at", "updated_at"]
+# HEADERS（todo_schema）を変えたら上げる（migrate_schema で記録、起動時に1回だけ照合）
+SCHEMA_VERSION = 3
+
+# トークン期限の何秒前にバックグラウンド更新するか
+TOKEN_REFRESH_MARGIN = int(os.getenv("SHEETS_TOKEN_REFRESH_MARGIN", "300"))
+# keep-alive で使い回すHTTP接続数（スレッド数に合わせる）
+HTTP_POOL_SIZE = int(os.getenv("SHEETS_HTTP_POOL_SIZE", "10"))
+# 行番号の検証を1セルずつ読む上限（超えたらA列ごと読み直す）
+ROW_VERIFY_LIMIT = 50
+# append_rows 1回あたりの最大行数（大量インポート時に分割）
+APPEND_CHUNK_ROWS = 500
+# list_todos のキャッシュ有効秒数（0でキャッシュしない）
+CACHE_TTL = float(os.getenv("TODO_CACHE_TTL", "30"))
+# 1にすると書き込みはジャーナルに記録してすぐ戻り、裏でまとめてSheetsに反映する
+# （ジャーナルは1プロセスで1ファイル。Streamlitアプリ向け）
+SHEETS_WRITE_BEHIND = os.getenv("SHEETS_WRITE_BEHIND", "") == "1"
+SHEETS_JOURNAL_PATH = os.getenv("SHEETS_JOURNAL_PATH", "sheets_journal.sqlite3")
+SHEETS_FLUSH_INTERVAL = float(os.getenv("SHEETS_FLUSH_INTERVAL", "2"))
+# 1にすると書き込みのたびに変更ログ（別ワークシート）にも記録し、
+# キャッシュを持っている読み手は全件ではなくログの続きだけ読んで追いつく
+SHEETS_CHANGELOG = os.getenv("SHEETS_CHANGELOG", "") == "1"
+CHANGELOG_SHEET = os.getenv("CHANGELOG_SHEET", f"{WORKSHEET_NAME}_changelog")
+# ログに載らない変更（シートを手で編集など）を拾うため、この秒数ごとに全件を取り直す
+CHANGELOG_FULL_REFRESH = float(os.getenv("CHANGELOG_FULL_REFRESH", "600"))
+# compact_changelog で残す件数
+CHANGELOG_KEEP = int(os.getenv("CHANGELOG_KEEP", "1000"))
+# archive_old_todos: 1回の batchUpdate で移す行数と、読んだアーカイブを使い回す秒数
+ARCHIVE_CHUNK_ROWS = 500
+ARCHIVE_CACHE_TTL = float(os.getenv("ARCHIVE_CACHE_TTL", "3600"))
 
 
 def _pick_service_account_path() -> str:
@@ -53,93 +97,1667 @@ def _get_credentials():
     return Credentials.from_service_account_info(info, scopes=SCOPES)
 
 
+# priority列が入る前のヘッダー
+_LEGACY_HEADERS = ["id", "title", "body", "due_date", "created_at", "updated_at"]
+
+
 def _ensure_headers(ws):
     """
-    既存シートが旧スキーマでも、ヘッダーにpriority列を追加して整合させる。
-    既にHEADERSなら何もしない。
+    既存シートが旧スキーマでも、データを動かさずに済む範囲でヘッダーを HEADERS に合わせる。
+    戻り値: 列の並びが HEADERS どおりになったか。
+    並びが違う（列の入れ替わり等）ときはヘッダーも触らずFalse（migrate_schema() で直す）。
     """
     row1 = ws.row_values(1)
     if not row1:
         ws.append_row(HEADERS)
-        return
+        return True
 
     # 先頭行がヘッダーだと仮定（運用前提）
     if row1 == HEADERS:
-        return
+        return True
 
-    # 旧ヘッダーの可能性
-    # 旧: ["id","title","body","due_date","created_at","updated_at"]
-    # 新: priorityを due_date の後ろに入れる
-    if "priority" not in row1:
-        # 列挿入（5列目=E列にpriorityを入れる）
-        # gspreadのinsert_colsは「列配列」を渡す形式
-        # ここではヘッダー行だけ追加して、データ行は空でOK（後で編集で埋める）
+    # 旧ヘッダー: priority を due_date の後ろに列ごと挿入する（データも一緒にずれる）
+    if row1 == _LEGACY_HEADERS:
+        # gspreadのinsert_colsは「列配列」を渡す形式。データ行は空でOK（後で編集で埋める）
         ws.insert_cols([["priority"]], col=5)
-        # updated_at列などが右にずれるので、ヘッダー行を正しい並びに揃える
-        ws.update("A1:G1", [HEADERS])
-        return
+        row1 = row1[:4] + ["priority"] + row1[4:]
 
-    # priorityはあるが順序がズレてる場合は揃える（軽く保守）
-    # データ並び替えまではしない（MVP）
-    ws.update(f"A1:{chr(64+len(HEADERS))}1", [HEADERS])
+    # HEADERS の先頭部分と一致（owner列が無い等）なら、足りない列名を後ろに書くだけ
+    if row1 == HEADERS[:len(row1)]:
+        # 列が足りないと範囲外への書き込みになるので先に広げる
+        if ws.col_count < len(HEADERS):
+            ws.add_cols(len(HEADERS) - ws.col_count)
+        first = _col_letter(HEADERS[len(row1)])
+        last = _col_letter(HEADERS[-1])
+        ws.update(f"{first}1:{last}1", [HEADERS[len(row1):]])
+        return True
 
+    # 並びが違う。ヘッダーだけ書き換えると全列のラベルがずれるので触らない
+    return False
+
+
+# ==========
+# スキーマバージョン（developer metadata）
+# ==========
+def _schema_key(ws):
+    return f"todo_schema_version:{ws.title}"
 
-def _get_worksheet():
-    creds = _get_credentials()
-    gc = gspread.authorize(creds)
-    ss = gc.open_by_url(SHEET_URL)
 
+def _read_metadata(ss, key):
+    """スプレッドシートの developer metadata の値（無ければNone）"""
+    meta = ss.fetch_sheet_metadata({"fields": "developerMetadata(metadataKey,metadataValue)"})
+    for m in meta.get("developerMetadata", []):
+        if m.get("metadataKey") == key:
+            return m.get("metadataValue", "")
+    return None
+
+
+def _read_schema_version(ss, ws):
+    value = _read_metadata(ss, _schema_key(ws))
     try:
-        ws = ss.worksheet(WORKSHEET_NAME)
-    except gspread.exceptions.WorksheetNotFound:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _schema_version_requests(ws, replace):
+    return _metadata_requests(_schema_key(ws), str(SCHEMA_VERSION), replace)
+
+
+def _metadata_requests(key, value, replace):
+    """developer metadata を書く batchUpdate のリクエスト（replace なら先に消す）"""
+    reqs = []
+    if replace:
+        reqs.append({
+            "deleteDeveloperMetadata": {
+                "dataFilter": {"developerMetadataLookup": {"metadataKey": key}}
+            }
+        })
+    reqs.append({
+        "createDeveloperMetadata": {
+            "developerMetadata": {
+                "metadataKey": key,
+                "metadataValue": value,
+                "location": {"spreadsheet": True},
+                "visibility": "DOCUMENT",
+            }
+        }
+    })
+    return reqs
+
+
+def migrate_schema():
+    """
+    既存シートを HEADERS の列順にそろえる（ヘッダーもデータ行も並べ替える）。
+    書き直しとスキーマバージョンの記録を batchUpdate 1回で行う（途中で失敗しても中途半端にならない）。
+    HEADERS に無い列は HEADERS の後ろに残す。1行目に id 列が無ければ何もせず RuntimeError。
+    戻り値: 並べ替えたデータ行数
+    """
+    global _conn, _row_index
+    with _lock:
+        # 元のヘッダーのまま読む（接続時のヘッダー補修をさせない）
+        _reset_client()
+        _conn = _connect(repair_headers=False)
+        ws = _conn["ws"]
+        ss = ws.spreadsheet
+        values = ws.get_all_values()
+
+        header = values[0] if values else []
+        if "id" not in header:
+            # ヘッダー行が無い・読めないのに並べ替えると、全行が空で上書きされる
+            raise RuntimeError(
+                f"1行目に id 列のヘッダーがありません（{header[:len(HEADERS)]}）。"
+                "ヘッダー行を確認してから migrate してください"
+            )
+        pos = {}
+        for i, name in enumerate(header):
+            pos.setdefault(name, i)
+        # HEADERSに無い列（独自に足した列など）は消さずに HEADERS の後ろへ移す
+        used = {pos[h] for h in HEADERS if h in pos}
+        width = max(len(r) for r in values)
+        extra = [i for i in range(width) if i not in used]
+
+        def cell(row, i):
+            return row[i] if i is not None and i < len(row) else ""
+
+        out = [HEADERS + [cell(header, i) for i in extra]]
+        for row in values[1:]:
+            out.append([cell(row, pos.get(h)) for h in HEADERS] + [cell(row, i) for i in extra])
+        width = len(out[0])
+
+        reqs = []
+        if ws.col_count < width:
+            reqs.append({
+                "appendDimension": {
+                    "sheetId": ws.id,
+                    "dimension": "COLUMNS",
+                    "length": width - ws.col_count,
+                }
+            })
+        reqs.append({
+            "updateCells": {
+                "start": {"sheetId": ws.id, "rowIndex": 0, "columnIndex": 0},
+                "rows": [
+                    {"values": [{"userEnteredValue": {"stringValue": str(v)}} for v in r]}
+                    for r in out
+                ],
+                "fields": "userEnteredValue",
+            }
+        })
+        current = _read_schema_version(ss, ws)
+        reqs.extend(_schema_version_requests(ws, replace=current is not None))
+        ss.batch_update({"requests": reqs})
+
+        # 行の中身が変わったので作り直させる
+        _row_index = None
+        _conn["schema_ok"] = True
+        _conn["header_ok"] = True
+        invalidate_cache()
+        return len(out) - 1
+
+
+# ==========
+# 接続キャッシュ（プロセス内で1つを共有）
+# ==========
+_lock = threading.RLock()
+_conn = None  # {"creds", "gc", "ss", "ws", "schema_ok", "header_ok", "log"}
+_refresh_timer = None
+
+
+def _connect(repair_headers=True):
+    if not SHEET_URL:
+        raise RuntimeError("SHEET_URL が未設定です")
+    with timed("sheets.auth"):
+        creds = _get_credentials()
+        # すべてのAPI呼び出しをレート制限＋再試行（sheets_gate）に通す
+        gc = gspread.authorize(creds, http_client=QuotaHTTPClient)
+
+        # 同じAuthorizedSessionを使い回す（keep-alive）。並列呼び出し分の接続を確保
+        session = gc.http_client.session
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        creds.refresh(Request(session))
+
+    with timed("sheets.open"):
+        ss = gc.open_by_url(SHEET_URL)
+    return dict(_open_sheets(ss, repair_headers), creds=creds, gc=gc)
+
+
+def _open_sheets(ss, repair_headers=True):
+    """
+    ワークシートを開いてスキーマを確認する。
+      schema_ok: migrate済み（列順が HEADERS どおりと記録されている）
+      header_ok: 列順が HEADERS どおり（書き込んでよい）
+    repair_headers=False なら旧ヘッダーの補修もしない（migrate_schema 用）
+    """
+    with timed("sheets.open"):
+        try:
+            ws = ss.worksheet(WORKSHEET_NAME)
+        except gspread.exceptions.WorksheetNotFound:
+            ws = None
+
+    if ws is None:
         ws = ss.add_worksheet(title=WORKSHEET_NAME, rows=200, cols=len(HEADERS))
         ws.append_row(HEADERS)
-        return ws
+        ss.batch_update({"requests": _schema_version_requests(ws, replace=False)})
+        schema_ok = header_ok = True
+    else:
+        # migrate済みならヘッダー行は見ない（プロセスごとに1回だけ確認）
+        with timed("sheets.header_check"):
+            schema_ok = _read_schema_version(ss, ws) == SCHEMA_VERSION
+            header_ok = schema_ok or (repair_headers and _ensure_headers(ws))
 
-    _ensure_headers(ws)
-    return ws
+    log = _open_changelog(ss) if SHEETS_CHANGELOG else None
+    return {"ss": ss, "ws": ws, "schema_ok": schema_ok, "header_ok": header_ok, "log": log}
 
 
-def list_todos():
-    ws = _get_worksheet()
-    return ws.get_all_records()
+def _check_writable():
+    """列の並びが HEADERS と違うシートには書かない（列位置で書くので値が別の列に入る）"""
+    _get_worksheet()
+    if not _conn.get("header_ok", True):
+        raise RuntimeError(
+            "シートの列の並びが HEADERS と違います。先に python sheets_db.py migrate を実行してください"
+        )
 
 
-def add_todo(title, body, due_date, priority):
-    ws = _get_worksheet()
+def _schedule_token_refresh():
+    """
+    トークン期限の少し前にバックグラウンドで更新しておく。
+    （リクエスト中に更新待ちが入らないように）
+    """
+    global _refresh_timer
+    if _refresh_timer is not None:
+        _refresh_timer.cancel()
+        _refresh_timer = None
+
+    if _conn is None or _conn["creds"].expiry is None:
+        return
+
+    left = (_conn["creds"].expiry - datetime.utcnow()).total_seconds()
+    delay = max(30.0, left - TOKEN_REFRESH_MARGIN)
+    _refresh_timer = threading.Timer(delay, _refresh_token)
+    _refresh_timer.daemon = True
+    _refresh_timer.start()
+
+
+def _refresh_token():
+    with _lock:
+        if _conn is None:
+            return
+        try:
+            with timed("sheets.auth"):
+                _conn["creds"].refresh(Request(_conn["gc"].http_client.session))
+        except Exception:
+            # 失敗したら接続ごと捨てる（次の呼び出しで作り直す）
+            _reset_client()
+            return
+        _schedule_token_refresh()
+
+
+def _reset_client():
+    global _conn, _refresh_timer
+    with _lock:
+        if _refresh_timer is not None:
+            _refresh_timer.cancel()
+            _refresh_timer = None
+        if _conn is not None:
+            try:
+                _conn["gc"].http_client.session.close()
+            except Exception:
+                pass
+        _conn = None
+
+
+def _get_worksheet():
+    global _conn
+    with _lock:
+        if _conn is None:
+            _conn = _connect()
+            _schedule_token_refresh()
+        return _conn["ws"]
+
+
+def _get_spreadsheet():
+    with _lock:
+        _get_worksheet()
+        return _conn["ss"]
+
+
+def _is_reconnect_error(e, idempotent):
+    # 認証系はリクエスト自体が処理されていないので常に再試行してよい
+    if isinstance(e, RefreshError):
+        return True
+    if isinstance(e, gspread.exceptions.APIError):
+        return e.code == 401
+    # 通信系は「書き込みが届いていた」可能性があるので冪等な操作だけ
+    if isinstance(e, (TransportError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return idempotent
+    return False
+
+
+def _with_worksheet(fn, idempotent=True):
+    """
+    キャッシュ済みワークシートで fn(ws) を実行する。
+    認証/通信エラーなら接続を作り直して1回だけ再試行。
+    """
+    try:
+        return fn(_get_worksheet())
+    except Exception as e:
+        if not _is_reconnect_error(e, idempotent):
+            raise
+        _reset_client()
+        return fn(_get_worksheet())
+
+
+# ==========
+# id → 行番号インデックス
+# ==========
+# A列（id）だけ読んで作り、自分の書き込みで更新する。
+# 他プロセスの削除で行がズレることがあるので、書き込み前に検証する。
+_row_index = None  # {id: 行番号(1始まり、1行目はヘッダー)}
+
+
+def _load_row_index(ws):
+    ids = ws.col_values(1)
+    return {v: i for i, v in enumerate(ids[1:], start=2) if v}
+
+
+def _verify_rows(ws, rows):
+    """インデックス上の行に本当にそのidがあるか（A列の該当セルだけ読む）"""
+    if not rows:
+        return True
+    if len(rows) > ROW_VERIFY_LIMIT:
+        return False
+
+    items = list(rows.items())
+    got = ws.batch_get([f"A{r}" for _, r in items])
+    for (todo_id, _), vr in zip(items, got):
+        cell = vr[0][0] if vr and vr[0] else ""
+        if cell != todo_id:
+            return False
+    return True
+
+
+def _resolve_rows(ws, ids):
+    """
+    ids の行番号を {id: 行番号} で返す（見つからないidは含まない）。
+    インデックスが古い（検証NG・知らないid）ならA列から作り直す。
+    呼び出し側は _lock を持ったまま書き込みまで行うこと。
+    """
+    global _row_index
+    ids = set(ids)
+
+    if _row_index is not None:
+        rows = {i: _row_index[i] for i in ids if i in _row_index}
+        if len(rows) == len(ids) and _verify_rows(ws, rows):
+            return rows
+
+    _row_index = _load_row_index(ws)
+    return {i: _row_index[i] for i in ids if i in _row_index}
+
+
+def _index_appended(todo_ids, resp):
+    """append の応答（updatedRange）から追加行の行番号を記録"""
+    if _row_index is None:
+        return
+    try:
+        rng = resp["updates"]["updatedRange"].split("!")[-1]
+        start = int("".join(ch for ch in rng.split(":")[0] if ch.isdigit()))
+    except (KeyError, TypeError, ValueError):
+        return
+    for n, todo_id in enumerate(todo_ids):
+        _row_index[todo_id] = start + n
+
+
+def _index_deleted(deleted):
+    """deleted: {id: 行番号}。消した行より下の行番号を、上で消えた行数だけ詰める"""
+    if _row_index is None:
+        return
+    gone = sorted(deleted.values())
+    for todo_id in deleted:
+        _row_index.pop(todo_id, None)
+    for k, v in _row_index.items():
+        n = bisect.bisect_left(gone, v)
+        if n:
+            _row_index[k] = v - n
+
+
+# ==========
+# list_todos の読み取りキャッシュ
+# ==========
+# TTL内はそのまま返す。TTLを過ぎたらDriveの modifiedTime だけ見て、
+# 変わっていなければ全件を取り直さない。自分の書き込みはその場で反映する。
+_cache = {
+    "rows": None, "by_id": {}, "remote": None, "checked_at": 0.0, "version": 0, "proj": {},
+    # 変更ログのどこまで反映済みか（SHEETS_CHANGELOG=1 のとき）
+    "log_seq": None, "log_base": 0, "full_at": 0.0,
+}
+_cache_stats = {"hits": 0, "misses": 0, "revalidated": 0, "projected": 0, "synced": 0}
+
+
+@timed("sheets.revalidate")
+def _remote_version():
+    """スプレッドシートの最終更新時刻（取れなければNone＝毎回取り直す）"""
+    try:
+        return _get_spreadsheet().get_lastUpdateTime()
+    except Exception:
+        return None
+
+
+def _cached_rows():
+    now = time.monotonic()
+
+    if _cache["rows"] is not None and CACHE_TTL > 0:
+        if now - _cache["checked_at"] < CACHE_TTL:
+            _cache_stats["hits"] += 1
+            return _cache["rows"]
+
+        remote = _remote_version()
+        if remote is not None and remote == _cache["remote"]:
+            _cache["checked_at"] = now
+            _cache_stats["hits"] += 1
+            _cache_stats["revalidated"] += 1
+            return _cache["rows"]
+
+        # 変わっていたら、まず変更ログの続きだけで追いつけるか試す
+        if remote is not None and _sync_from_changelog():
+            _cache["remote"] = remote
+            _cache["checked_at"] = time.monotonic()
+            _cache_stats["synced"] += 1
+            return _cache["rows"]
+    else:
+        remote = _remote_version() if CACHE_TTL > 0 else None
+
+    # ログの位置は全件を読む前に取る（間に入った変更は次の同期で重ねて当てる）
+    log_head = _changelog_head()
+    with timed("sheets.read"):
+        rows = _with_worksheet(lambda ws: ws.get_all_records())
+    # まだSheetsに反映していない書き込みを重ねる
+    rows = _overlay_pending(rows)
+    _cache["rows"] = rows
+    _cache["by_id"] = {str(r.get("id", "")): r for r in rows}
+    _cache["remote"] = remote
+    _cache["checked_at"] = time.monotonic()
+    _cache["log_base"], _cache["log_seq"] = log_head if log_head else (0, None)
+    _cache["full_at"] = _cache["checked_at"]
+    _cache["version"] += 1
+    _cache_stats["misses"] += 1
+    return rows
+
+
+def _cache_fresh():
+    return (
+        _cache["rows"] is not None
+        and CACHE_TTL > 0
+        and time.monotonic() - _cache["checked_at"] < CACHE_TTL
+    )
+
+
+def _cache_changed():
+    # 列だけ取った結果は書き込みがあったら捨てる（パッチしない）
+    _cache["proj"] = {}
+    _cache["version"] += 1
+
+
+def _cache_added(rows):
+    if _cache["rows"] is not None:
+        for row in rows:
+            rec = dict(zip(HEADERS, row))
+            _cache["rows"].append(rec)
+            _cache["by_id"][rec["id"]] = rec
+    _cache_changed()
+
+
+def _cache_updated(changes):
+    """changes: [(id, {列: 値}), ...]（何行でもバージョンは1つだけ進める）"""
+    for todo_id, fields in changes:
+        rec = _cache["by_id"].get(todo_id)
+        if rec is not None:
+            rec.update(fields)
+    _cache_changed()
+
+
+def _cache_removed(todo_ids):
+    if _cache["rows"] is not None:
+        todo_ids = set(todo_ids)
+        _cache["rows"] = [r for r in _cache["rows"] if str(r.get("id", "")) not in todo_ids]
+        for todo_id in todo_ids:
+            _cache["by_id"].pop(todo_id, None)
+    _cache_changed()
+
+
+def invalidate_cache():
+    """次の list_todos で必ず取り直す"""
+    with _lock:
+        _cache["rows"] = None
+        _cache["by_id"] = {}
+        _archive_cache.clear()
+        _cache_changed()
+
+
+def cache_stats():
+    with _lock:
+        return dict(_cache_stats, version=_cache["version"], ttl=CACHE_TTL)
+
+
+def stats():
+    """キャッシュとAPI呼び出し（レート制限・再試行）、write-behind の統計"""
+    return {"cache": cache_stats(), "api": gate_stats(), "write_behind": write_behind_stats()}
+
+
+def data_version():
+    """キャッシュ内容が変わるたびに増える番号（呼び出し側のメモ化キー用）"""
+    with _lock:
+        return _cache["version"]
+
+
+def check_version():
+    """
+    list_todos() と同じ鮮度確認（TTL / modifiedTime）だけして data_version を返す。
+    行はコピーしないので、呼び出し側の派生データを作り直すか決めるのに使う。
+    """
+    with _lock:
+        _cached_rows()
+        return _cache["version"]
+
+
+def list_todos(columns=None):
+    """
+    全件を dict のリストで返す。
+    columns を指定するとその列だけ返す（例: ["id", "title", "due_date"]）。
+    全件キャッシュが新しければそこから切り出し、無ければ列ごとに batch_get で取る。
+    """
+    if columns is not None:
+        return _list_columns(list(columns))
+
+    with _lock:
+        rows = _cached_rows()
+        # 呼び出し側が書き換えてもキャッシュが壊れないようにコピーを返す
+        return [dict(r) for r in rows]
+
+
+# ==========
+# 書き込み通知
+# ==========
+_listeners = []
+
+
+def add_change_listener(fn):
+    """
+    自プロセスの書き込み後に fn(due_dates, before, after) を呼ぶ。
+    due_dates: 影響した due_date の値（新旧）の集合。分からなければ None（全部）。
+    before/after: 書き込み前後の data_version。
+      before時点で作った派生データは、due_dates以外の日付ならafterでも有効。
+    ロック中に呼ぶので fn は軽い処理だけにすること。
+    """
+    with _lock:
+        _listeners.append(fn)
+
+
+def _notify(due_dates, before):
+    for fn in list(_listeners):
+        try:
+            fn(due_dates, before, _cache["version"])
+        except Exception:
+            pass
+
+
+def _cached_due_dates(todo_ids):
+    """キャッシュにある旧due_date（無いidがあればNone＝特定できない）"""
+    out = set()
+    for todo_id in todo_ids:
+        rec = _cache["by_id"].get(todo_id)
+        if rec is None:
+            return None
+        out.add(str(rec.get("due_date", "")))
+    return out
+
+
+def snapshot(columns=None):
+    """
+    (data_version, list_todos(columns)) を同じ時点で返す。
+    索引など「取得結果から作る派生データ」をバージョンでメモ化する用。
+    """
+    with _lock:
+        rows = list_todos(columns)
+        return _cache["version"], rows
+
+
+def _list_columns(columns):
+    for c in columns:
+        if c not in HEADERS:
+            raise ValueError(f"unknown column: {c}")
+
+    with _lock:
+        if _cache_fresh():
+            _cache_stats["hits"] += 1
+            return [{c: r.get(c, "") for c in columns} for r in _cache["rows"]]
+
+        if _has_pending():
+            # 列だけ読むとジャーナル分が見えないので全件キャッシュから
+            return [{c: r.get(c, "") for c in columns} for r in _cached_rows()]
+
+        key = tuple(columns)
+        hit = _cache["proj"].get(key)
+        if hit is not None and CACHE_TTL > 0:
+            # TTLを過ぎても、modifiedTime が同じか変更ログで追いつければ使い続ける
+            if time.monotonic() - hit["checked_at"] < CACHE_TTL or _revalidate_projection(columns, hit):
+                _cache_stats["hits"] += 1
+                return [dict(r) for r in hit["rows"]]
+
+        _get_worksheet()
+        if not _conn["schema_ok"]:
+            # 列順が HEADERS どおりか保証できない（未migrate）ので全件から切り出す
+            rows = _cached_rows()
+            return [{c: r.get(c, "") for c in columns} for r in rows]
+
+        # 全件キャッシュと同じく、読む前の modifiedTime（と変更ログの位置）を控える。
+        # 初回は読むだけにして（remind のような1回きりの実行で呼び出しを増やさない）、
+        # TTL切れで取り直すときから控える。次のTTL切れからは modifiedTime を見るだけで済む
+        remote = _remote_version() if CACHE_TTL > 0 and hit is not None else None
+        log_head = _changelog_head() if remote is not None and "id" in columns else None
+        rows = _with_worksheet(lambda ws: _fetch_columns(ws, columns))
+        now = time.monotonic()
+        _cache["proj"][key] = {
+            "rows": rows, "checked_at": now, "fetched_at": now, "remote": remote, "log": log_head,
+        }
+        # 取り直しても中身が同じなら data_version は進めない（呼び出し側のメモ化を生かす）
+        if hit is None or hit["rows"] != rows:
+            _cache["version"] += 1
+        _cache_stats["misses"] += 1
+        _cache_stats["projected"] += 1
+        return [dict(r) for r in rows]
+
+
+def _revalidate_projection(columns, entry):
+    """
+    列だけ取った結果（_cache["proj"] の1件）を、全件と同じ手順で確かめる。
+    modifiedTime が同じならそのまま、変わっていれば変更ログの続きだけを当てる。
+    変わっていてログで追いつけない（ログ無効・id列なし等）ならFalse（呼び出し側で取り直す）。
+    """
+    if entry["remote"] is None:
+        return False
+    remote = _remote_version()
+    if remote is None:
+        return False
+
+    if remote != entry["remote"]:
+        if entry["log"] is None or "id" not in columns:
+            return False
+        if time.monotonic() - entry["fetched_at"] > CHANGELOG_FULL_REFRESH:
+            return False
+        got = _read_changelog(*entry["log"])
+        if got is None:
+            return False
+        changes, base = got
+        rows = _apply_changes([dict(r) for r in entry["rows"]], changes, columns)
+        if rows != entry["rows"]:
+            entry["rows"] = rows
+            _cache["version"] += 1
+        entry["log"] = (base, changes[-1][0])
+        entry["remote"] = remote
+        _cache_stats["synced"] += 1
+    else:
+        _cache_stats["revalidated"] += 1
+    entry["checked_at"] = time.monotonic()
+    return True
+
+
+@timed("sheets.read_columns")
+def _fetch_columns(ws, columns):
+    global _row_index
+    letters = [_col_letter(c) for c in columns]
+    got = ws.batch_get([f"{x}2:{x}" for x in letters], major_dimension="COLUMNS")
+    cols = [vr[0] if vr else [] for vr in got]
+
+    if "id" in columns:
+        # id列を読んだついでに行インデックスも作る（get_todo_fields でA列を読み直さない）
+        ids = cols[columns.index("id")]
+        with _lock:
+            _row_index = {v: i for i, v in enumerate(ids, start=2) if v}
+
+    n = max([len(col) for col in cols] + [0])
+    return [
+        {c: (col[i] if i < len(col) else "") for c, col in zip(columns, cols)}
+        for i in range(n)
+    ]
+
+
+def get_todo_fields(todo_ids, columns):
+    """
+    指定idの行だけ読んで {id: {列: 値}} で返す（見つからないidは含まない）。
+    list_todos(columns=...) で絞り込んだ後に、一致した行の body だけ取る用途。
+    全件キャッシュが無ければ毎回その行だけ読む（変更ログでの追従はしない。読むのは数行なので）。
+    """
+    todo_ids = list(dict.fromkeys(todo_ids))
+    columns = list(columns)
+    if not todo_ids:
+        return {}
+
+    with _lock:
+        if _cache_fresh():
+            _cache_stats["hits"] += 1
+            return {
+                i: {c: _cache["by_id"][i].get(c, "") for c in columns}
+                for i in todo_ids
+                if i in _cache["by_id"]
+            }
+
+        _get_worksheet()
+        if not _conn["schema_ok"] or _has_pending():
+            by_id = {str(r.get("id", "")): r for r in _cached_rows()}
+            return {i: {c: by_id[i].get(c, "") for c in columns} for i in todo_ids if i in by_id}
+
+    return _with_worksheet(lambda ws: _fetch_rows(ws, todo_ids, columns))
+
+
+@timed("sheets.read_rows")
+def _fetch_rows(ws, todo_ids, columns):
+    global _row_index
+    last = _col_letter(HEADERS[-1])
+
+    with _lock:
+        fresh = _row_index is None
+        if fresh:
+            _row_index = _load_row_index(ws)
+
+        # 読んだ行のA列でインデックスを検証。ズレていたら1回だけ作り直す
+        for _ in range(2):
+            rows = {i: _row_index[i] for i in todo_ids if i in _row_index}
+            items = list(rows.items())
+            got = ws.batch_get([f"A{r}:{last}{r}" for _, r in items]) if items else []
+
+            out = {}
+            stale = False
+            for (todo_id, _), vr in zip(items, got):
+                row = vr[0] if vr else []
+                if not row or row[0] != todo_id:
+                    stale = True
+                    break
+                out[todo_id] = {
+                    c: (row[HEADERS.index(c)] if HEADERS.index(c) < len(row) else "")
+                    for c in columns
+                }
+
+            if not stale and (len(out) == len(todo_ids) or fresh):
+                return out
+            _row_index = _load_row_index(ws)
+            fresh = True
+        return out
+
+
+def add_todo(title, body, due_date, priority, owner=""):
+    return add_todos([{
+        "title": title,
+        "body": body,
+        "due_date": due_date,
+        "priority": priority,
+        "owner": owner,
+    }])[0]
+
+
+def add_todos(todos):
+    """
+    まとめて追加する（append_rows 1回。多い場合は APPEND_CHUNK_ROWS 行ずつ）。
+    todos: [{"title": ..., "body": ..., "due_date": ..., "priority": ..., "owner": ...}, ...]
+           owner は省略可
+    戻り値: 追加したidのリスト（入力順）
+    """
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    todo_id = str(uuid.uuid4())
-    ws.append_row([todo_id, title, body, str(due_date), str(priority), now, now])
-    return todo_id
+    rows = []
+    for t in todos:
+        rows.append([
+            str(uuid.uuid4()),
+            t.get("title", ""),
+            t.get("body", ""),
+            str(t.get("due_date", "")),
+            str(t.get("priority", "")),
+            now,
+            now,
+            str(t.get("owner", "")),
+        ])
+
+    if _journal() is not None:
+        _enqueue_adds(rows)
+    else:
+        _append_rows(rows)
+    return [r[0] for r in rows]
+
+
+@timed("sheets.write.add")
+def _append_rows(rows, patch_cache=True):
+    _check_writable()
+
+    def _add(ws, chunk):
+        with _lock:
+            before = _cache["version"]
+            log_req = _changelog_request([("add", r[0], dict(zip(HEADERS[1:], r[1:]))) for r in chunk])
+            if log_req is None:
+                resp = ws.append_rows(chunk)
+                _index_appended([r[0] for r in chunk], resp)
+            else:
+                # 本体への追記とログを batchUpdate 1回で（appendCells は行番号を返さないので
+                # インデックスには載せず、次に要るときに _resolve_rows が作り直す）
+                ws.spreadsheet.batch_update({"requests": [_append_cells_request(ws, chunk), log_req]})
+            if patch_cache:
+                _cache_added(chunk)
+                _notify({r[HEADERS.index("due_date")] for r in chunk}, before)
+
+    for k in range(0, len(rows), APPEND_CHUNK_ROWS):
+        chunk = rows[k:k + APPEND_CHUNK_ROWS]
+        _with_worksheet(lambda ws: _add(ws, chunk), idempotent=False)
 
 
 def update_todo(todo_id, new_title, new_body, new_due_date, new_priority):
-    ws = _get_worksheet()
-    rows = ws.get_all_values()
+    result = update_todos([{
+        "id": todo_id,
+        "title": new_title,
+        "body": new_body,
+        "due_date": new_due_date,
+        "priority": new_priority,
+    }])
+    if not result[todo_id]:
+        raise ValueError("todo_id not found")
+    return True
+
+
+def update_todos(updates):
+    """
+    複数行をまとめて更新する（書き込みは batch_update 1回）。
+    updates: [{"id": ..., "title": ..., "body": ..., "due_date": ..., "priority": ..., "owner": ...}, ...]
+             id以外は省略可（省略した列は触らない）
+    戻り値: {id: 見つかって更新したか}
+    """
+    updates = [dict(u) for u in updates]
+    if not updates:
+        return {}
+    if _journal() is not None:
+        return _enqueue_updates(updates)
+    return _write_updates(updates)
+
+
+@timed("sheets.write.update")
+def _write_updates(updates, patch_cache=True):
+    """
+    updates の各要素に "updated_at" があればその時刻で書く（write-behind の反映用）。
+    """
+    _check_writable()
+    result = {u["id"]: False for u in updates}
+
+    def _update(ws):
+        with _lock:
+            row_of = _resolve_rows(ws, result)
+
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            data = []
+            for u in updates:
+                r = row_of.get(u["id"])
+                if r is None:
+                    continue
+                data.extend(_row_update_ranges(r, u, u.get("updated_at", now)))
+                result[u["id"]] = True
+
+            if not data:
+                return result
+            before = _cache["version"]
+            log_req = _changelog_request([
+                ("update", u["id"], dict(
+                    {k: _cell_value(k, u[k]) for k in EDITABLE_FIELDS if k in u},
+                    updated_at=u.get("updated_at", now),
+                ))
+                for u in updates if result[u["id"]]
+            ])
+            if log_req is None:
+                ws.batch_update([{"range": _range_a1(r, c, vals), "values": [vals]} for r, c, vals in data])
+            else:
+                # 本体の更新とログを batchUpdate 1回で（片方だけ書けることがない）
+                reqs = [_update_cells_request(ws, r, c, vals) for r, c, vals in data]
+                ws.spreadsheet.batch_update({"requests": reqs + [log_req]})
+            if not patch_cache:
+                return result
+
+            changed = [u for u in updates if result[u["id"]]]
+            due_dates = _cached_due_dates(u["id"] for u in changed)
+            if due_dates is not None:
+                due_dates |= {str(u["due_date"]) for u in changed if "due_date" in u}
+            _cache_updated([
+                (u["id"], dict({k: _cell_value(k, u[k]) for k in EDITABLE_FIELDS if k in u}, updated_at=now))
+                for u in changed
+            ])
+            _notify(due_dates, before)
+            return result
+
+    return _with_worksheet(_update)
+
+
+def _col_letter(name):
+    return chr(ord("A") + HEADERS.index(name))
+
 
-    for i, row in enumerate(rows):
-        if row and row[0] == todo_id:
-            # 新スキーマ:
-            # A:id  B:title  C:body  D:due_date  E:priority  F:created_at  G:updated_at
-            r = i + 1
-            ws.update(f"B{r}", new_title)
-            ws.update(f"C{r}", new_body)
-            ws.update(f"D{r}", str(new_due_date))
-            ws.update(f"E{r}", str(new_priority))
-            ws.update(f"G{r}", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-            return True
+def _cell_value(k, v):
+    # title/body はそのまま、それ以外（date等）は文字列にして書く
+    return v if k in ("title", "body") else str(v)
 
-    raise ValueError("todo_id not found")
+
+def _row_update_ranges(r, fields, now):
+    """
+    1行分の更新を「連続した列ごとのレンジ」にまとめる。
+    例: title〜priority + updated_at → B{r}:E{r} と G{r}（owner もあれば G{r}:H{r}）
+    戻り値: [(行番号, 先頭列の位置(0始まり), [値, ...]), ...]
+    """
+    cells = []
+    for k in EDITABLE_FIELDS:
+        if k in fields:
+            cells.append((HEADERS.index(k), _cell_value(k, fields[k])))
+    cells.append((HEADERS.index("updated_at"), now))
+    cells.sort()
+
+    ranges = []
+    group = [cells[0]]
+    for c in cells[1:]:
+        if c[0] == group[-1][0] + 1:
+            group.append(c)
+            continue
+        ranges.append(group)
+        group = [c]
+    ranges.append(group)
+
+    return [(r, g[0][0], [v for _, v in g]) for g in ranges]
+
+
+def _range_a1(r, c, values):
+    first = _col_letter(HEADERS[c])
+    last = _col_letter(HEADERS[c + len(values) - 1])
+    return f"{first}{r}" if first == last else f"{first}{r}:{last}{r}"
+
+
+def _string_cells(values):
+    # values.update（RAW）と同じく、文字列のまま書く
+    return {"values": [{"userEnteredValue": {"stringValue": str(v)}} for v in values]}
+
+
+def _update_cells_request(ws, r, c, values):
+    return {
+        "updateCells": {
+            "start": {"sheetId": ws.id, "rowIndex": r - 1, "columnIndex": c},
+            "rows": [_string_cells(values)],
+            "fields": "userEnteredValue",
+        }
+    }
+
+
+def _append_cells_request(ws, rows):
+    return {
+        "appendCells": {
+            "sheetId": ws.id,
+            "rows": [_string_cells(row) for row in rows],
+            "fields": "userEnteredValue",
+        }
+    }
 
 
 def delete_todo(todo_id):
-    ws = _get_worksheet()
-    rows = ws.get_all_values()
+    if not delete_todos([todo_id])[todo_id]:
+        raise ValueError("todo_id not found")
+    return True
+
+
+def delete_todos(todo_ids):
+    """
+    まとめて削除する。
+    行番号を1回で解決 → 隣り合う行をレンジにまとめる → 下から順に
+    deleteDimension を並べて batchUpdate 1回で消す（行ズレの影響を受けない）。
+    戻り値: {id: 見つかって削除したか}
+    """
+    todo_ids = list(todo_ids)
+    if not todo_ids:
+        return {}
+    if _journal() is not None:
+        return _enqueue_deletes(todo_ids)
+    return _delete_rows(todo_ids)
+
+
+@timed("sheets.write.delete")
+def _delete_rows(todo_ids, patch_cache=True):
+    _check_writable()
+    result = {todo_id: False for todo_id in todo_ids}
+
+    def _delete(ws):
+        with _lock:
+            row_of = _resolve_rows(ws, result)
+            if not row_of:
+                return result
+
+            requests_ = _delete_requests(ws, row_of)
+            before = _cache["version"]
+            ws.spreadsheet.batch_update({"requests": requests_})
+
+            due_dates = _cached_due_dates(row_of)
+            _index_deleted(row_of)
+            if patch_cache:
+                _cache_removed(row_of)
+                _notify(due_dates, before)
+            for todo_id in row_of:
+                result[todo_id] = True
+            return result
+
+    return _with_worksheet(_delete, idempotent=False)
+
+
+def _delete_requests(ws, row_of):
+    """
+    {id: 行番号} の行を消す batchUpdate のリクエスト。
+    隣り合う行をレンジにまとめ、下から順に並べる（行ズレの影響を受けない）。
+    """
+    # ヘッダー行は消さない前提（行番号は2以上）
+    requests_ = []
+    for start, end in reversed(_group_rows(row_of.values())):
+        requests_.append({
+            "deleteDimension": {
+                "range": {
+                    "sheetId": ws.id,
+                    "dimension": "ROWS",
+                    "startIndex": start - 1,
+                    "endIndex": end,
+                }
+            }
+        })
+    # 変更ログへの記録も同じbatchUpdateに入れる（削除と記録が必ずそろう）
+    log_req = _changelog_request([("delete", todo_id, {}) for todo_id in row_of])
+    if log_req is not None:
+        requests_.append(log_req)
+    return requests_
+
+
+def _group_rows(rows):
+    """[5, 2, 3, 9] → [(2, 3), (5, 5), (9, 9)]（昇順の連続レンジ）"""
+    ranges = []
+    for r in sorted(set(rows)):
+        if ranges and r == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], r)
+        else:
+            ranges.append((r, r))
+    return ranges
+
+
+# ==========
+# 変更ログ（SHEETS_CHANGELOG=1）
+# ==========
+# 別ワークシートに 1変更1行で追記する: seq / op(add|update|delete) / id / fields(JSON) / at
+# 1行目はヘッダー。F1 = 圧縮で消した件数（base）、G1 = 最新のseq（数式）。
+# seq は =ROW()-1+$F$1 なので、古い行を消して F1 を増やしても値は変わらない。
+# シートの本体は書き込み側が直接更新するので、ログは「何が変わったか」を伝えるだけ。
+# 追加・更新・削除とも、本体への書き込みとログの追記は同じ batchUpdate 1回で行う。
+# 読み手は全件キャッシュも列だけの結果（list_todos(columns)）もログの続きで追いつく。
+_LOG_HEADERS = ["seq", "op", "id", "fields", "at"]
+
+
+def _open_changelog(ss):
+    try:
+        return ss.worksheet(CHANGELOG_SHEET)
+    except gspread.exceptions.WorksheetNotFound:
+        log = ss.add_worksheet(title=CHANGELOG_SHEET, rows=1000, cols=7)
+        log.update(
+            [_LOG_HEADERS + [0, "=COUNTA(A2:A)+F1"]],
+            "A1:G1",
+            value_input_option="USER_ENTERED",
+        )
+        return log
+
+
+def _changelog_ws():
+    with _lock:
+        _get_worksheet()
+        return _conn.get("log")
+
+
+def _changelog_request(entries):
+    """entries: [(op, id, fields), ...] → appendCells リクエスト（ログ無効ならNone）"""
+    log = _changelog_ws()
+    if log is None or not entries:
+        return None
+    at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def cell(v):
+        return {"userEnteredValue": {"stringValue": v}}
+
+    return {
+        "appendCells": {
+            "sheetId": log.id,
+            "rows": [
+                {"values": [
+                    {"userEnteredValue": {"formulaValue": "=ROW()-1+$F$1"}},
+                    cell(op),
+                    cell(todo_id),
+                    cell(json.dumps(fields, ensure_ascii=False)),
+                    cell(at),
+                ]}
+                for op, todo_id, fields in entries
+            ],
+            "fields": "userEnteredValue",
+        }
+    }
+
+
+def _changelog_head():
+    """(base, 最新seq)。ログ無効・読めなければNone"""
+    log = _changelog_ws()
+    if log is None:
+        return None
+    try:
+        head = log.batch_get(["F1:G1"])[0]
+        return _to_int(head[0][0]), _to_int(head[0][1])
+    except Exception:
+        return None
+
+
+def _to_int(v):
+    return int(str(v).replace(",", ""))
+
+
+def _parse_changelog(got):
+    """ログ行 → [(seq, op, id, fields), ...]"""
+    out = []
+    for row in got:
+        if len(row) < 3 or not row[0]:
+            continue
+        fields = json.loads(row[3]) if len(row) > 3 and row[3] else {}
+        out.append((_to_int(row[0]), row[1], row[2], fields))
+    return out
+
+
+def _read_changelog(base, seq):
+    """
+    seq より後のログ → (changes, base)。
+    追いつけない（ログ無効・圧縮で消えた・ログに無い変更）ならNone。
+    """
+    log = _changelog_ws()
+    if log is None or seq is None:
+        return None
+
+    try:
+        # 前回の base のままなら、先頭（F1:G1）と続きを1回で読める
+        head, got = log.batch_get(["F1:G1", f"A{seq - base + 2}:E"])
+        new_base, last = _to_int(head[0][0]), _to_int(head[0][1])
+        if new_base != base:
+            if seq < new_base:
+                # 読む前に圧縮で消されている
+                return None
+            base = new_base
+            got = log.batch_get([f"A{seq - base + 2}:E"])[0]
+        if last == seq:
+            # シートは変わったのにログは増えていない＝手での編集など
+            return None
+        changes = _parse_changelog(got)
+    except Exception:
+        return None
+
+    # seq が飛んでいたら（読む途中で圧縮された等）全件から
+    if not changes or changes[0][0] != seq + 1:
+        return None
+    for (a, *_), (b, *_) in zip(changes, changes[1:]):
+        if b != a + 1:
+            return None
+    return changes, base
+
+
+def _apply_changes(rows, changes, columns=None):
+    """
+    ログの変更を rows に当てた新しいリスト。
+    columns を指定すると、その列だけを持つ行（list_todos(columns) の結果）として当てる。
+    """
+    rows = list(rows)
+    by_id = {str(r.get("id", "")): r for r in rows}
+    for _, op, todo_id, fields in changes:
+        if columns is not None:
+            fields = {k: v for k, v in fields.items() if k in columns}
+        # 自分の書き込みも流れてくるので、何度当てても同じ結果になるように
+        if op == "add":
+            rec = by_id.get(todo_id)
+            if rec is None:
+                rec = dict.fromkeys(columns or (), "")
+                rec["id"] = todo_id
+                rows.append(rec)
+                by_id[todo_id] = rec
+            rec.update(fields)
+        elif op == "update":
+            rec = by_id.get(todo_id)
+            if rec is not None:
+                rec.update(fields)
+        elif op == "delete":
+            by_id.pop(todo_id, None)
+    return [r for r in rows if str(r.get("id", "")) in by_id]
+
+
+@timed("sheets.changelog_sync")
+def _sync_from_changelog():
+    """
+    キャッシュ済みの全件に、ログの続きだけを当てて追いつく。
+    追いつけない（ログ無効・圧縮で消えた・定期の全件取り直し・ログに無い変更）ならFalse。
+    """
+    if _cache["rows"] is None:
+        return False
+    if time.monotonic() - _cache["full_at"] > CHANGELOG_FULL_REFRESH:
+        return False
+    got = _read_changelog(_cache["log_base"], _cache["log_seq"])
+    if got is None:
+        return False
+    changes, base = got
+
+    rows = _overlay_pending(_apply_changes(_cache["rows"], changes))
+    _cache["rows"] = rows
+    _cache["by_id"] = {str(r.get("id", "")): r for r in rows}
+    _cache["log_seq"] = changes[-1][0]
+    _cache["log_base"] = base
+    _cache_changed()
+    return True
+
+
+def compact_changelog(keep=None):
+    """
+    古いログ行を消す（最新 keep 件を残す）。削除と F1(base) の更新は batchUpdate 1回。
+    本体シートは常に最新なので、ログを畳むのは消すだけでよい。
+    戻り値: 消した件数
+    """
+    keep = CHANGELOG_KEEP if keep is None else keep
+    log = _changelog_ws()
+    if log is None:
+        raise RuntimeError("SHEETS_CHANGELOG=1 のときだけ使えます")
+
+    head = _changelog_head()
+    if head is None:
+        raise RuntimeError(f"変更ログ（{CHANGELOG_SHEET}）の F1:G1 を読めません。ヘッダー行を確認してください")
+    base, last = head
+    n = (last - base) - keep
+    if n <= 0:
+        return 0
+    _get_spreadsheet().batch_update({"requests": [
+        {"deleteDimension": {"range": {
+            "sheetId": log.id, "dimension": "ROWS", "startIndex": 1, "endIndex": 1 + n,
+        }}},
+        {"updateCells": {
+            "start": {"sheetId": log.id, "rowIndex": 0, "columnIndex": 5},
+            "rows": [{"values": [{"userEnteredValue": {"numberValue": base + n}}]}],
+            "fields": "userEnteredValue",
+        }},
+    ]})
+    return n
+
+
+# ==========
+# アーカイブ（期日の古いタスクを月別ワークシートへ移す）
+# ==========
+# 本体（WORKSHEET_NAME）には最近のタスクだけを置き、list_todos は本体だけを読む。
+# 期日が古いものは期日の月ごとのワークシート（todos_2026_09 など）へ移し、
+# list_archived(月) で呼ばれたときだけ読む。
+_archive_cache = {}  # {"2026-09": (取得時刻, rows)}
+
+
+def _archive_title(month):
+    """月 "2026-09" → ワークシート名 "todos_2026_09"（WORKSHEET_NAME_YYYY_MM）"""
+    if not re.fullmatch(r"\d{4}-\d{2}", month):
+        raise ValueError(f"month は YYYY-MM で指定してください: {month}")
+    return f"{WORKSHEET_NAME}_{month.replace('-', '_')}"
+
+
+def archived_months():
+    """アーカイブのある月を古い順に（["2026-08", "2026-09", ...]）"""
+    pat = re.compile(rf"{re.escape(WORKSHEET_NAME)}_(\d{{4}})_(\d{{2}})")
+    sheets = _with_worksheet(lambda ws: ws.spreadsheet.worksheets())
+    months = []
+    for w in sheets:
+        m = pat.fullmatch(w.title)
+        if m:
+            months.append(f"{m.group(1)}-{m.group(2)}")
+    return sorted(months)
+
+
+def list_archived(month, columns=None):
+    """
+    アーカイブした月（"2026-09"）のタスクを dict のリストで返す（無い月は []）。
+    columns は list_todos と同じ。
+    """
+    title = _archive_title(month)
+    if columns is not None:
+        columns = list(columns)
+        for c in columns:
+            if c not in HEADERS:
+                raise ValueError(f"unknown column: {c}")
+
+    with _lock:
+        hit = _archive_cache.get(month)
+        if hit is None or time.monotonic() - hit[0] > ARCHIVE_CACHE_TTL:
+            hit = (time.monotonic(), _with_worksheet(lambda ws: _read_archive(ws.spreadsheet, title)))
+            _archive_cache[month] = hit
+        rows = hit[1]
+
+    if columns is None:
+        return [dict(r) for r in rows]
+    return [{c: r.get(c, "") for c in columns} for r in rows]
+
+
+def _read_archive(ss, title):
+    try:
+        values = ss.worksheet(title).get_all_values()
+    except gspread.exceptions.WorksheetNotFound:
+        return []
+    if not values:
+        return []
+    header = values[0]
+    return [
+        {h: (row[i] if i < len(row) else "") for i, h in enumerate(header) if h}
+        for row in values[1:]
+        if row and row[0]
+    ]
+
+
+def _archive_cutoff_key():
+    return f"todo_archive_cutoff:{WORKSHEET_NAME}"
+
+
+def archive_cutoff():
+    """
+    アーカイブにあるかもしれない期日の境目（archive_old_todos が使った一番新しい基準日）。
+    これより前の期日だけアーカイブを読めばよい。まだ一度も移していなければNone。
+    """
+    with _lock:
+        hit = _archive_cache.get("cutoff")
+        if hit is None or time.monotonic() - hit[0] > ARCHIVE_CACHE_TTL:
+            value = _with_worksheet(lambda ws: _read_metadata(ws.spreadsheet, _archive_cutoff_key()))
+            hit = (time.monotonic(), _parse_cutoff(value))
+            _archive_cache["cutoff"] = hit
+        return hit[1]
+
+
+def _parse_cutoff(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _record_archive_cutoff(ss, cutoff):
+    """基準日を記録する（前より新しいときだけ。古い基準日で移しても読む範囲は狭めない）"""
+    value = _read_metadata(ss, _archive_cutoff_key())
+    current = _parse_cutoff(value)
+    if current is None or current < cutoff:
+        ss.batch_update({
+            "requests": _metadata_requests(_archive_cutoff_key(), cutoff.isoformat(), replace=value is not None)
+        })
+        current = cutoff
+    _archive_cache["cutoff"] = (time.monotonic(), current)
+
+
+def _archive_sheets(ss, months):
+    """{月: ワークシート}。無い月は作ってヘッダーを書く"""
+    existing = {w.title: w for w in ss.worksheets()}
+    out = {}
+    for month in months:
+        title = _archive_title(month)
+        ws = existing.get(title)
+        if ws is None:
+            ws = ss.add_worksheet(title=title, rows=1, cols=len(HEADERS))
+            ws.append_row(HEADERS)
+        out[month] = ws
+    return out
+
+
+@timed("sheets.archive")
+def archive_old_todos(days):
+    """
+    期日が days 日より前のタスクを、期日の月のアーカイブへ移す。
+    ARCHIVE_CHUNK_ROWS 行ずつ「アーカイブへ追記＋本体から削除」を batchUpdate 1回で行う
+    （途中で失敗しても、二重になったり消えたりしない）。期日が空・読めない行は移さない。
+    移すのは各まとまりの直前に読み直した値（最初の全件読み込みの後の編集も失わない）。
+    戻り値: {月: 移した件数}
+    """
+    if days < 0:
+        raise ValueError("days は0以上で指定してください")
+    cutoff = date.today() - timedelta(days=days)
+    _check_writable()
+    if _journal() is not None:
+        # 未反映の書き込みを先に反映してから移す
+        flush()
+
+    # 本体を1回だけ読んで、移す行を決める（列順は1行目のヘッダーに従う）
+    values = _with_worksheet(lambda ws: ws.get_all_values())
+    if not values:
+        return {}
+    header = values[0]
+    old = []
+    for row in values[1:]:
+        rec = {h: (row[i] if i < len(row) else "") for i, h in enumerate(header)}
+        d = parse_due_date(rec.get("due_date"))
+        if rec.get("id") and d is not None and d < cutoff:
+            old.append((d.strftime("%Y-%m"), [rec.get(h, "") for h in HEADERS]))
+    if not old:
+        return {}
+
+    # 読み手（due_index.archived_between）はこの基準日より前だけアーカイブを読む。
+    # 移す前に記録する（途中で失敗しても、読み手がアーカイブを余分に読むだけで済む）
+    _with_worksheet(lambda ws: _record_archive_cutoff(ws.spreadsheet, cutoff))
+
+    # 月ごとにまとめて、1回の batchUpdate が触るシートを少なくする（月内はシートの行順のまま）
+    old.sort(key=lambda x: x[0])
+    sheets = _with_worksheet(lambda ws: _archive_sheets(ws.spreadsheet, sorted({m for m, _ in old})))
+
+    moved = {}
+    for k in range(0, len(old), ARCHIVE_CHUNK_ROWS):
+        chunk = old[k:k + ARCHIVE_CHUNK_ROWS]
+        for month, n in _with_worksheet(lambda ws: _move_to_archive(ws, chunk, sheets, cutoff), idempotent=False).items():
+            moved[month] = moved.get(month, 0) + n
+    return moved
+
+
+def _move_to_archive(ws, chunk, sheets, cutoff):
+    with _lock:
+        row_of = _resolve_rows(ws, [row[0] for _, row in chunk])
+        if not row_of:
+            # 読んでから今までに全部消されていた
+            return {}
+
+        # 最初の一括読み込みから今までに編集されていることがあるので、移す直前の値を読み直す
+        # （batch_get 1回。期日が変わって対象外になった行はここで外す）
+        last = _col_letter(HEADERS[-1])
+        # アーカイブでも本体の行順を保つ
+        items = sorted(row_of.items(), key=lambda x: x[1])
+        got = ws.batch_get([f"A{r}:{last}{r}" for _, r in items])
+        row_of = {}
+        by_month = {}
+        for (todo_id, r), vr in zip(items, got):
+            row = vr[0] if vr else []
+            if not row or row[0] != todo_id:
+                # 行がずれた（他の削除など）。次回に回す
+                continue
+            row = row + [""] * (len(HEADERS) - len(row))
+            d = parse_due_date(row[HEADERS.index("due_date")])
+            month = d.strftime("%Y-%m") if d is not None else None
+            if d is None or d >= cutoff or month not in sheets:
+                continue
+            row_of[todo_id] = r
+            by_month.setdefault(month, []).append(row)
+        if not row_of:
+            return {}
+
+        requests_ = []
+        for month, rows in by_month.items():
+            requests_.append({
+                "appendCells": {
+                    "sheetId": sheets[month].id,
+                    "rows": [
+                        {"values": [{"userEnteredValue": {"stringValue": str(v)}} for v in row]}
+                        for row in rows
+                    ],
+                    "fields": "userEnteredValue",
+                }
+            })
+        requests_.extend(_delete_requests(ws, row_of))
+        before = _cache["version"]
+        ws.spreadsheet.batch_update({"requests": requests_})
+
+        due_dates = _cached_due_dates(row_of)
+        _index_deleted(row_of)
+        _cache_removed(row_of)
+        for month in by_month:
+            _archive_cache.pop(month, None)
+        _notify(due_dates, before)
+        return {month: len(rows) for month, rows in by_month.items()}
+
+
+# ==========
+# write-behind（SHEETS_WRITE_BEHIND=1）
+# ==========
+# 書き込みはジャーナル（SQLite）に記録してキャッシュに反映したらすぐ戻る。
+# 裏のスレッドが SHEETS_FLUSH_INTERVAL 秒ごとに、同じidへの操作をまとめて
+# append_rows / batch_update / deleteDimension をそれぞれ最大1回で反映する。
+# 起動時に残っていた分（前回落ちたときの未反映分）も同じように反映される。
+_wb = {"journal": None, "thread": None, "event": threading.Event(), "flush_lock": threading.Lock()}
+_wb_stats = {"enqueued": 0, "flushes": 0, "flushed_entries": 0, "api_writes": 0, "errors": 0, "last_error": ""}
+
+
+def _journal():
+    if not SHEETS_WRITE_BEHIND:
+        return None
+    with _lock:
+        if _wb["journal"] is None:
+            _wb["journal"] = Journal(SHEETS_JOURNAL_PATH)
+            t = threading.Thread(target=_flush_loop, name="sheets-flush", daemon=True)
+            t.start()
+            _wb["thread"] = t
+            atexit.register(flush)
+        return _wb["journal"]
+
+
+def _has_pending():
+    j = _journal()
+    return j is not None and len(j) > 0
+
+
+def _overlay_pending(rows):
+    j = _journal()
+    if j is None or len(j) == 0:
+        return rows
+
+    adds, updates, deletes, _ = coalesce(j.pending())
+    by_id = {str(r.get("id", "")): r for r in rows}
+    for a in adds:
+        if a["id"] in by_id:
+            by_id[a["id"]].update(a)
+        else:
+            rec = dict(a)
+            rows.append(rec)
+            by_id[a["id"]] = rec
+    for u in updates:
+        rec = by_id.get(u["id"])
+        if rec is not None:
+            rec.update({k: v for k, v in u.items() if k != "id"})
+    if deletes:
+        gone = set(deletes)
+        rows = [r for r in rows if str(r.get("id", "")) not in gone]
+    return rows
+
+
+def _known_ids():
+    """存在確認用（キャッシュが無ければ読む。ジャーナル分は重なっている）"""
+    if _cache["rows"] is None:
+        _cached_rows()
+    return _cache["by_id"]
+
+
+def _enqueue_adds(rows):
+    with _lock:
+        before = _cache["version"]
+        _journal().append([("add", r[0], {"row": dict(zip(HEADERS, r))}) for r in rows])
+        _wb_stats["enqueued"] += len(rows)
+        _cache_added(rows)
+        _notify({r[HEADERS.index("due_date")] for r in rows}, before)
+
+
+def _enqueue_updates(updates):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with _lock:
+        known = _known_ids()
+        result = {u["id"]: u["id"] in known for u in updates}
+        changed = [u for u in updates if result[u["id"]]]
+        if not changed:
+            return result
+
+        before = _cache["version"]
+        entries = []
+        for u in changed:
+            fields = {k: _cell_value(k, u[k]) for k in EDITABLE_FIELDS if k in u}
+            entries.append(("update", u["id"], {"fields": fields, "updated_at": now}))
+        _journal().append(entries)
+        _wb_stats["enqueued"] += len(entries)
+
+        due_dates = _cached_due_dates(u["id"] for u in changed)
+        if due_dates is not None:
+            due_dates |= {str(u["due_date"]) for u in changed if "due_date" in u}
+        _cache_updated([(todo_id, dict(p["fields"], updated_at=now)) for _, todo_id, p in entries])
+        _notify(due_dates, before)
+        return result
+
+
+def _enqueue_deletes(todo_ids):
+    with _lock:
+        known = _known_ids()
+        result = {todo_id: todo_id in known for todo_id in todo_ids}
+        gone = [todo_id for todo_id, ok in result.items() if ok]
+        if not gone:
+            return result
+
+        before = _cache["version"]
+        _journal().append([("delete", todo_id, {}) for todo_id in gone])
+        _wb_stats["enqueued"] += len(gone)
+        due_dates = _cached_due_dates(gone)
+        _cache_removed(gone)
+        _notify(due_dates, before)
+        return result
+
+
+def _flush_loop():
+    while True:
+        _wb["event"].wait(SHEETS_FLUSH_INTERVAL)
+        _wb["event"].clear()
+        try:
+            flush()
+        except Exception as e:
+            with _lock:
+                _wb_stats["errors"] += 1
+                _wb_stats["last_error"] = repr(e)
+            traceback.print_exc()
+            # 失敗が続くときは間隔を空ける（次の周期で再試行）
+            time.sleep(SHEETS_FLUSH_INTERVAL)
+
+
+@timed("sheets.flush")
+def flush():
+    """
+    ジャーナルの未反映分をまとめてSheetsに書く。戻り値: 反映したエントリ数
+    （write-behind が無効なら何もしない）
+    """
+    j = _journal()
+    if j is None:
+        return 0
+
+    with _wb["flush_lock"]:
+        entries = j.pending()
+        if not entries:
+            return 0
+        last = entries[-1][0]
+        j.mark_attempt(last)
+
+        adds, updates, deletes, retried = coalesce(entries)
+        if retried:
+            # 前回 append が届いたあとで落ちていたら二重に足さない
+            present = _with_worksheet(lambda ws: _resolve_rows(ws, retried))
+            adds = [a for a in adds if a["id"] not in present]
+
+        writes = 0
+        if adds:
+            _append_rows([[str(a.get(c, "")) for c in HEADERS] for a in adds], patch_cache=False)
+            writes += -(-len(adds) // APPEND_CHUNK_ROWS)
+        if updates:
+            _write_updates(updates, patch_cache=False)
+            writes += 1
+        if deletes:
+            _delete_rows(deletes, patch_cache=False)
+            writes += 1
+
+        j.done(last)
+        with _lock:
+            _wb_stats["flushes"] += 1
+            _wb_stats["flushed_entries"] += len(entries)
+            _wb_stats["api_writes"] += writes
+        return len(entries)
+
+
+def write_behind_stats():
+    j = _wb["journal"]
+    with _lock:
+        return dict(_wb_stats, enabled=SHEETS_WRITE_BEHIND, pending=len(j) if j is not None else 0)
+
+
+if __name__ == "__main__":
+    # 使い方: SHEET_URL=... python sheets_db.py migrate
+    #        SHEET_URL=... SHEETS_CHANGELOG=1 python sheets_db.py compact-changelog
+    #        SHEET_URL=... python sheets_db.py archive [日数]
+    import sys
 
-    for i, row in enumerate(rows):
-        if row and row[0] == todo_id:
-            # 行削除（ヘッダー行を消さない前提）
-            ws.delete_rows(i + 1)
-            return True
+    if sys.argv[1:] == ["migrate"]:
+        n = migrate_schema()
+        print(f"migrated {n} rows to schema v{SCHEMA_VERSION}")
+    elif sys.argv[1:] == ["compact-changelog"]:
+        n = compact_changelog()
+        print(f"removed {n} changelog rows (kept {CHANGELOG_KEEP})")
+    elif sys.argv[1:2] == ["archive"] and len(sys.argv) <= 3:
+        from todo_store import ARCHIVE_AFTER_DAYS
 
-    raise ValueError("todo_id not found")
+        days = int(sys.argv[2]) if len(sys.argv) == 3 else ARCHIVE_AFTER_DAYS
+        moved = archive_old_todos(days)
+        for month, n in sorted(moved.items()):
+            print(f"{month}: {n}")
+        print(f"archived {sum(moved.values())} rows (due before {days} days ago)")
+    else:
+        print("usage: python sheets_db.py migrate | compact-changelog | archive [days]")
+        sys.exit(2)
@@ -0,0 +1,134 @@
+"""
+Sheets / Drive API 呼び出しの関所（レート制限＋再試行）
+
+gspread の HTTPClient を差し替えて、すべてのリクエストを
+  1. トークンバケットで絞る（プロセス内のスレッドで共有。SHEETS_RATE_FILE を指定すると
+     そのファイルをロックして複数プロセスでも共有）
+  2. 429 / 5xx はジッターつき指数バックオフで再試行
+する。待った時間や再試行の回数は gate_stats() で見られる。
+"""
+import os
+import random
+import threading
+import time
+
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+from metrics import count, timed
+from rate_limit import FileTokenBucket, TokenBucket
+
+# 1分あたりのリクエスト数（既定はSheets APIの「ユーザーごと毎分60回」）とバースト
+SHEETS_RATE_PER_MIN = float(os.getenv("SHEETS_RATE_PER_MIN", "60"))
+SHEETS_BURST = float(os.getenv("SHEETS_BURST", "10"))
+# 空ならプロセス内だけで制限。パスを指定すると同じファイルを見るプロセス間で共有
+SHEETS_RATE_FILE = os.getenv("SHEETS_RATE_FILE", "")
+# 再試行の回数とバックオフの上限（秒）
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "5"))
+SHEETS_BACKOFF_MAX = float(os.getenv("SHEETS_BACKOFF_MAX", "32"))
+
+_lock = threading.Lock()
+_bucket = None
+_stats = {
+    "requests": 0,
+    "throttled": 0,     # 429 / usageLimits を受けた回数
+    "server_errors": 0,  # 5xx を受けた回数
+    "retries": 0,
+    "gave_up": 0,
+    "limiter_waits": 0,  # バケットで待たされたリクエスト数
+    "limiter_wait_s_total": 0.0,
+    "limiter_wait_s_max": 0.0,
+    "backoff_s_total": 0.0,
+}
+
+
+def _get_bucket():
+    global _bucket
+    with _lock:
+        if _bucket is None:
+            rate = SHEETS_RATE_PER_MIN / 60.0
+            if SHEETS_RATE_FILE:
+                _bucket = FileTokenBucket(SHEETS_RATE_FILE, rate, SHEETS_BURST)
+            else:
+                _bucket = TokenBucket(rate, SHEETS_BURST)
+        return _bucket
+
+
+def _count(**kw):
+    with _lock:
+        for k, v in kw.items():
+            _stats[k] += v
+
+
+def _is_rate_limited(e: APIError) -> bool:
+    if e.code == 429:
+        return True
+    # Drive API は使用量制限でも 403 を返す（errors[0].domain == "usageLimits"）
+    errors = e.error.get("errors") or [{}]
+    return e.code == 403 and errors[0].get("domain") == "usageLimits"
+
+
+def _is_idempotent(method: str, endpoint: str) -> bool:
+    """
+    5xx で再試行してよいか。5xx は「処理されていた」可能性があるので、
+    読み取りと値の上書き（values:batchUpdate / PUT）だけ。append や行削除は再試行しない。
+    """
+    method = method.lower()
+    if method in ("get", "put"):
+        return True
+    return endpoint.endswith(("values:batchGet", "values:batchUpdate"))
+
+
+def _backoff(attempt: int, e: APIError) -> float:
+    retry_after = e.response.headers.get("Retry-After") if e.response is not None else None
+    if retry_after:
+        try:
+            return min(SHEETS_BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    # full jitter: 0〜min(上限, 2^attempt) 秒
+    return random.uniform(0, min(SHEETS_BACKOFF_MAX, 2.0 ** (attempt + 1)))
+
+
+class QuotaHTTPClient(HTTPClient):
+    """gspread.authorize(creds, http_client=QuotaHTTPClient) で使う"""
+
+    def request(self, method, endpoint, *args, **kwargs):
+        bucket = _get_bucket()
+        for attempt in range(SHEETS_MAX_RETRIES + 1):
+            waited = bucket.acquire()
+            with _lock:
+                _stats["requests"] += 1
+                if waited > 0:
+                    _stats["limiter_waits"] += 1
+                    _stats["limiter_wait_s_total"] += waited
+                    _stats["limiter_wait_s_max"] = max(_stats["limiter_wait_s_max"], waited)
+
+            try:
+                with timed("sheets.http"):
+                    return super().request(method, endpoint, *args, **kwargs)
+            except APIError as e:
+                if _is_rate_limited(e):
+                    _count(throttled=1)
+                    count("sheets_api_errors", reason="throttled")
+                elif e.code >= 500 and _is_idempotent(method, endpoint):
+                    _count(server_errors=1)
+                    count("sheets_api_errors", reason="server_error")
+                else:
+                    raise
+                if attempt == SHEETS_MAX_RETRIES:
+                    _count(gave_up=1)
+                    raise
+                wait = _backoff(attempt, e)
+
+            _count(retries=1, backoff_s_total=wait)
+            time.sleep(wait)
+
+
+def gate_stats() -> dict:
+    with _lock:
+        s = dict(_stats)
+    s["limiter_wait_s_avg"] = s["limiter_wait_s_total"] / s["requests"] if s["requests"] else 0.0
+    s["rate_per_min"] = SHEETS_RATE_PER_MIN
+    s["shared_file"] = SHEETS_RATE_FILE or None
+    return s
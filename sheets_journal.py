@@ -0,0 +1,101 @@
+"""
+書き込みジャーナル（sheets_db の write-behind 用）
+
+追加・更新・削除をまずローカルのSQLiteに記録し、後でまとめてSheetsに反映する。
+プロセスが落ちても未反映の分は次の起動で反映される。
+1つのジャーナルファイルを使うのは1プロセスだけにすること（二重に反映しないように）。
+"""
+import json
+import sqlite3
+import threading
+import time
+
+
+class Journal:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS journal (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    op TEXT NOT NULL,
+                    todo_id TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL
+                )
+                """
+            )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+
+    def __len__(self):
+        return self._count
+
+    def append(self, entries):
+        """entries: [(op, id, payload(dict)), ...] を1トランザクションで記録"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO journal (op, todo_id, payload, created) VALUES (?, ?, ?, ?)",
+                [(op, todo_id, json.dumps(payload, ensure_ascii=False), now) for op, todo_id, payload in entries],
+            )
+            self._count += len(entries)
+
+    def pending(self):
+        """未反映の分を記録順に: [(seq, op, id, payload, attempts), ...]"""
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT seq, op, todo_id, payload, attempts FROM journal ORDER BY seq"
+            )
+            return [(seq, op, i, json.loads(p), a) for seq, op, i, p, a in cur]
+
+    def mark_attempt(self, upto_seq: int):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE journal SET attempts = attempts + 1 WHERE seq <= ?", (upto_seq,))
+
+    def done(self, upto_seq: int):
+        with self._lock, self._conn:
+            cur = self._conn.execute("DELETE FROM journal WHERE seq <= ?", (upto_seq,))
+            self._count -= cur.rowcount
+
+
+def coalesce(entries):
+    """
+    同じidへの操作を1つにまとめる。
+      add → update … 値を足した add
+      add → delete … 何もしない
+      update → update … 後勝ちでマージした update
+      update → delete / delete … delete
+    戻り値: (adds, updates, deletes, retried_add_ids)
+      adds: [{列: 値}]（id込み）, updates: [{"id", 列..., "updated_at"}], deletes: [id]
+      retried_add_ids: 前回の反映途中で落ちたかもしれない add の id（既に書けていないか確認する）
+    """
+    state = {}
+    retried = set()
+    for _, op, todo_id, payload, attempts in entries:
+        cur = state.get(todo_id)
+        if op == "add":
+            state[todo_id] = ["add", dict(payload["row"])]
+            if attempts:
+                retried.add(todo_id)
+        elif op == "update":
+            fields = dict(payload["fields"], updated_at=payload["updated_at"])
+            if cur is None:
+                state[todo_id] = ["update", fields]
+            elif cur[0] in ("add", "update"):
+                cur[1].update(fields)
+            # 削除後の更新は捨てる
+        elif op == "delete":
+            if cur is not None and cur[0] == "add" and todo_id not in retried:
+                # まだSheetsに無い行なので何も書かなくてよい
+                state[todo_id] = ["noop"]
+            else:
+                state[todo_id] = ["delete"]
+
+    adds = [s[1] for s in state.values() if s[0] == "add"]
+    updates = [dict(s[1], id=i) for i, s in state.items() if s[0] == "update"]
+    deletes = [i for i, s in state.items() if s[0] == "delete"]
+    return adds, updates, deletes, retried & {a["id"] for a in adds}
@@ -0,0 +1,280 @@
+"""
+SQLite版のTodo保存先（todo_store.TodoStore の実装）
+
+列と値の形は sheets_db と同じ（すべて文字列、並びは追加順）。
+ローカルでの負荷試験・ベンチマークや、Sheetsの手前に置く高速な保存先として使う。
+"""
+import sqlite3
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+
+from todo_schema import EDITABLE_FIELDS, HEADERS, parse_due_date
+from todo_store import TodoStore
+
+# SQLiteの1文あたりのプレースホルダ数の上限に収める
+_IN_CHUNK = 500
+
+
+def _cell_value(v):
+    return "" if v is None else str(v)
+
+
+class SqliteStore(TodoStore):
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            # 読み取り（別プロセスのStreamlit等）が書き込みを待たないように
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+
+        self._version = 0
+        self._seen = self._external_version()
+        self._listeners = []
+
+    def _create_schema(self):
+        cols = ", ".join(f"{c} TEXT NOT NULL DEFAULT ''" for c in HEADERS if c != "id")
+        with self._conn:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS todos (id TEXT PRIMARY KEY, {cols})")
+            # id は PRIMARY KEY の索引、期日での絞り込み用に due_date にも索引
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_todos_due_date ON todos(due_date)")
+            # アーカイブは月ごとのワークシートの代わりに month 列で分ける
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS todos_archive (month TEXT NOT NULL, id TEXT PRIMARY KEY, {cols})"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_todos_archive_month ON todos_archive(month)")
+            # archive_cutoff など（Sheetsの developer metadata の代わり）
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    # ==========
+    # バージョン
+    # ==========
+    def _external_version(self):
+        # 他の接続（別プロセス）がコミットすると増える。自分のコミットでは変わらない
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def check_version(self):
+        with self._lock:
+            seen = self._external_version()
+            if seen != self._seen:
+                self._seen = seen
+                self._version += 1
+            return self._version
+
+    def data_version(self):
+        with self._lock:
+            return self._version
+
+    def invalidate_cache(self):
+        with self._lock:
+            self._version += 1
+
+    def add_change_listener(self, fn):
+        with self._lock:
+            self._listeners.append(fn)
+
+    def _notify(self, due_dates, before):
+        for fn in list(self._listeners):
+            try:
+                fn(due_dates, before, self._version)
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            n = self._conn.execute("SELECT COUNT(*) FROM todos").fetchone()[0]
+            return {"version": self._version, "rows": n, "path": self.path}
+
+    # ==========
+    # 読み取り
+    # ==========
+    @staticmethod
+    def _check_columns(columns):
+        for c in columns:
+            if c not in HEADERS:
+                raise ValueError(f"unknown column: {c}")
+
+    def list_todos(self, columns=None):
+        columns = list(columns) if columns is not None else HEADERS
+        self._check_columns(columns)
+        with self._lock:
+            cur = self._conn.execute(f"SELECT {', '.join(columns)} FROM todos ORDER BY rowid")
+            return [dict(zip(columns, r)) for r in cur]
+
+    def snapshot(self, columns=None):
+        with self._lock:
+            version = self.check_version()
+            return version, self.list_todos(columns)
+
+    def get_todo_fields(self, todo_ids, columns):
+        todo_ids = list(dict.fromkeys(todo_ids))
+        columns = list(columns)
+        self._check_columns(columns)
+
+        out = {}
+        with self._lock:
+            for k in range(0, len(todo_ids), _IN_CHUNK):
+                chunk = todo_ids[k:k + _IN_CHUNK]
+                cur = self._conn.execute(
+                    f"SELECT id, {', '.join(columns)} FROM todos WHERE id IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for r in cur:
+                    out[r[0]] = dict(zip(columns, r[1:]))
+        return out
+
+    def _due_dates(self, todo_ids):
+        """{id: due_date}（存在するidだけ）"""
+        out = {}
+        for k in range(0, len(todo_ids), _IN_CHUNK):
+            chunk = todo_ids[k:k + _IN_CHUNK]
+            cur = self._conn.execute(
+                f"SELECT id, due_date FROM todos WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            out.update(cur.fetchall())
+        return out
+
+    # ==========
+    # 書き込み（まとめて1トランザクション）
+    # ==========
+    def add_todos(self, todos):
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
+        for t in todos:
+            rec = {c: _cell_value(t.get(c, "")) for c in EDITABLE_FIELDS}
+            rec.update(id=str(uuid.uuid4()), created_at=now, updated_at=now)
+            rows.append([rec[c] for c in HEADERS])
+
+        with self._lock:
+            before = self._version
+            with self._conn:
+                self._conn.executemany(
+                    f"INSERT INTO todos ({', '.join(HEADERS)}) VALUES ({', '.join('?' * len(HEADERS))})",
+                    rows,
+                )
+            self._version += 1
+            self._notify({r[HEADERS.index("due_date")] for r in rows}, before)
+        return [r[0] for r in rows]
+
+    def update_todos(self, updates):
+        updates = [dict(u) for u in updates]
+        result = {u["id"]: False for u in updates}
+        if not updates:
+            return result
+
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            old_due = self._due_dates(list(result))
+            before = self._version
+            with self._conn:
+                for u in updates:
+                    fields = [k for k in EDITABLE_FIELDS if k in u]
+                    sets = ", ".join(f"{k} = ?" for k in fields + ["updated_at"])
+                    cur = self._conn.execute(
+                        f"UPDATE todos SET {sets} WHERE id = ?",
+                        [_cell_value(u[k]) for k in fields] + [now, u["id"]],
+                    )
+                    result[u["id"]] = cur.rowcount > 0
+
+            changed = [u for u in updates if result[u["id"]]]
+            if changed:
+                self._version += 1
+                due_dates = {old_due[u["id"]] for u in changed}
+                due_dates |= {_cell_value(u["due_date"]) for u in changed if "due_date" in u}
+                self._notify(due_dates, before)
+        return result
+
+    def delete_todos(self, todo_ids):
+        result = {todo_id: False for todo_id in todo_ids}
+        if not result:
+            return result
+
+        with self._lock:
+            old_due = self._due_dates(list(result))
+            if not old_due:
+                return result
+            before = self._version
+            ids = list(old_due)
+            with self._conn:
+                for k in range(0, len(ids), _IN_CHUNK):
+                    chunk = ids[k:k + _IN_CHUNK]
+                    self._conn.execute(
+                        f"DELETE FROM todos WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                    )
+            self._version += 1
+            for todo_id in ids:
+                result[todo_id] = True
+            self._notify(set(old_due.values()), before)
+        return result
+
+    # ==========
+    # アーカイブ
+    # ==========
+    def archive_old_todos(self, days):
+        if days < 0:
+            raise ValueError("days は0以上で指定してください")
+        cutoff = date.today() - timedelta(days=days)
+        with self._lock:
+            current = self.archive_cutoff()
+            if current is None or current < cutoff:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('archive_cutoff', ?)",
+                        (cutoff.isoformat(),),
+                    )
+            moves = []
+            due_dates = set()
+            for todo_id, due in self._conn.execute("SELECT id, due_date FROM todos"):
+                d = parse_due_date(due)
+                if d is not None and d < cutoff:
+                    moves.append((d.strftime("%Y-%m"), todo_id))
+                    due_dates.add(due)
+            if not moves:
+                return {}
+
+            before = self._version
+            cols = ", ".join(HEADERS)
+            with self._conn:
+                for k in range(0, len(moves), _IN_CHUNK):
+                    chunk = moves[k:k + _IN_CHUNK]
+                    self._conn.executemany(
+                        f"INSERT OR REPLACE INTO todos_archive (month, {cols}) SELECT ?, {cols} FROM todos WHERE id = ?",
+                        chunk,
+                    )
+                    self._conn.execute(
+                        f"DELETE FROM todos WHERE id IN ({', '.join('?' * len(chunk))})",
+                        [todo_id for _, todo_id in chunk],
+                    )
+            self._version += 1
+            self._notify(due_dates, before)
+
+        moved = {}
+        for month, _ in moves:
+            moved[month] = moved.get(month, 0) + 1
+        return moved
+
+    def archive_cutoff(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'archive_cutoff'").fetchone()
+        return date.fromisoformat(row[0]) if row else None
+
+    def archived_months(self):
+        with self._lock:
+            cur = self._conn.execute("SELECT DISTINCT month FROM todos_archive ORDER BY month")
+            return [r[0] for r in cur]
+
+    def list_archived(self, month, columns=None):
+        columns = list(columns) if columns is not None else HEADERS
+        self._check_columns(columns)
+        with self._lock:
+            cur = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM todos_archive WHERE month = ? ORDER BY rowid", (month,)
+            )
+            return [dict(zip(columns, r)) for r in cur]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,7 +1,7 @@
 from datetime import date
 from sheets_db import add_todo, list_todos
 
-todo_id = add_todo("テスト", "スプレッドシートに保存できるか確認", date.today())
+todo_id = add_todo("テスト", "スプレッドシートに保存できるか確認", date.today(), "Medium")
 print("added:", todo_id)
 
 rows = list_todos()
@@ -0,0 +1,86 @@
+"""
+jp_date（日本語の日付表現パーサ）のテスト
+
+  python -m pytest -q test_jp_date.py
+"""
+from datetime import date
+
+import pytest
+
+from jp_date import parse_date_jp, parse_date_range_jp
+
+TODAY = date(2026, 10, 17)  # 土曜日
+
+
+def d(m, day, y=2026):
+    return date(y, m, day)
+
+
+@pytest.mark.parametrize("text, want", [
+    ("2月14日の予定", d(2, 14, 2027)),
+    ("2/14", d(2, 14, 2027)),
+    ("10-20", d(10, 20)),
+    ("今日", TODAY),
+    ("明日の予定", d(10, 18)),
+    ("あさって", d(10, 19)),
+    ("来週水曜日", d(10, 21)),
+    ("20日", d(10, 20)),
+    ("14日", d(11, 14)),
+    ("来週の打ち合わせってどうなってたっけ？明日の予定も教えて", d(10, 18)),
+    ("こんにちは", None),
+    ("", None),
+])
+def test_single_day(text, want):
+    assert parse_date_jp(text, TODAY) == want
+
+
+@pytest.mark.parametrize("text, want", [
+    ("今週末", (d(10, 17), d(10, 18))),
+    ("今週", (d(10, 17), d(10, 18))),
+    ("来週", (d(10, 19), d(10, 25))),
+    ("2/14〜2/16", (d(2, 14, 2027), d(2, 16, 2027))),
+    ("2月14日から16日", (d(2, 14, 2027), d(2, 16, 2027))),
+    ("10/14〜10/20", (d(10, 14), d(10, 20))),
+    ("12/28〜1/5", (d(12, 28), d(1, 5, 2027))),
+    ("今日〜明日", (d(10, 17), d(10, 18))),
+])
+def test_range(text, want):
+    assert parse_date_range_jp(text, TODAY) == want
+
+
+def test_bare_day_after_relative_start_is_not_a_range_end():
+    # 「3日」は11/3ではなく長さ。範囲にせず今日だけ
+    assert parse_date_range_jp("今日から3日", TODAY) == (TODAY, TODAY)
+
+
+@pytest.mark.parametrize("text, want", [
+    ("今日から3日間", (d(10, 17), d(10, 19))),
+    ("明日3日間", (d(10, 18), d(10, 20))),
+    ("10/30から5日間", (d(10, 30), d(11, 3))),
+])
+def test_span(text, want):
+    assert parse_date_range_jp(text, TODAY) == want
+
+
+@pytest.mark.parametrize("text, want", [
+    ("10/20〜10/14", (d(10, 14), d(10, 20))),
+    ("明日〜今日", (d(10, 17), d(10, 18))),
+    ("10月20日から10月14日", (d(10, 14), d(10, 20))),
+])
+def test_reversed_range_is_swapped(text, want):
+    assert parse_date_range_jp(text, TODAY) == want
+
+
+@pytest.mark.parametrize("text, want", [
+    ("２／１４", (d(2, 14, 2027), d(2, 14, 2027))),
+    ("２－１４", (d(2, 14, 2027), d(2, 14, 2027))),
+    ("２／１４～２／１６", (d(2, 14, 2027), d(2, 16, 2027))),
+    ("１０月２０日", (d(10, 20), d(10, 20))),
+    ("今日から３日間", (d(10, 17), d(10, 19))),
+])
+def test_full_width(text, want):
+    assert parse_date_range_jp(text, TODAY) == want
+
+
+def test_invalid_date():
+    assert parse_date_jp("2/30", TODAY) is None
@@ -0,0 +1,81 @@
+"""
+sheets_db.migrate_schema() のテスト（fake_gspread の手元シートで、接続時のヘッダー確認から通す）
+
+  python -m pytest -q test_migrate_schema.py
+"""
+import pytest
+
+import sheets_db
+from fake_gspread import ApiMeter, FakeSpreadsheet
+
+
+class _Creds:
+    expiry = None
+
+
+@pytest.fixture
+def sheet(monkeypatch):
+    """rows を入れた手元のシートへ sheets_db をつなぐ。戻り値: 本体ワークシート"""
+    monkeypatch.setattr(sheets_db, "SHEETS_CHANGELOG", False)
+    monkeypatch.setattr(sheets_db, "SHEETS_WRITE_BEHIND", False)
+    monkeypatch.setattr(sheets_db, "_schedule_token_refresh", lambda: None)
+
+    def install(rows):
+        ss = FakeSpreadsheet(ApiMeter())
+        ws = ss.add_worksheet(sheets_db.WORKSHEET_NAME, cols=max(len(r) for r in rows), rows_data=rows)
+        sheets_db._reset_client()
+        monkeypatch.setattr(
+            sheets_db,
+            "_connect",
+            lambda repair_headers=True: dict(sheets_db._open_sheets(ss, repair_headers), creds=_Creds(), gc=None),
+        )
+        sheets_db._row_index = None
+        sheets_db.invalidate_cache()
+        return ws
+
+    yield install
+    sheets_db._reset_client()
+    sheets_db.invalidate_cache()
+
+
+def test_reorders_data(sheet):
+    header = ["id", "title", "body", "priority", "due_date", "created_at", "updated_at", "owner"]
+    row = ["a", "T", "B", "High", "2026-01-02", "c", "u", "me"]
+    ws = sheet([header, row])
+
+    sheets_db.list_todos()
+    assert ws.rows[0] == header  # 接続しただけではヘッダーを書き換えない
+    with pytest.raises(RuntimeError):
+        sheets_db.update_todo("a", "T2", "B", None, "Low")
+
+    assert sheets_db.migrate_schema() == 1
+    assert sheets_db.list_todos() == [dict(zip(header, row))]
+
+
+def test_keeps_extra_columns(sheet):
+    header = ["id", "title", "memo", "body", "due_date", "priority", "created_at", "updated_at", "owner"]
+    row = ["a", "T", "独自メモ", "B", "2026-01-02", "High", "c", "u", "me"]
+    ws = sheet([header, row, ["b", "T2", "", "B2"]])
+
+    sheets_db.migrate_schema()
+    assert ws.rows[0] == sheets_db.HEADERS + ["memo"]
+    assert ws.rows[1] == ["a", "T", "B", "2026-01-02", "High", "c", "u", "me", "独自メモ"]
+    assert ws.rows[2][:3] == ["b", "T2", "B2"]
+    assert {r["id"]: r for r in sheets_db.list_todos()}["a"]["due_date"] == "2026-01-02"
+
+
+def test_refuses_sheet_without_header(sheet):
+    rows = [["a", "T", "B", "2026-01-02", "High", "c", "u", ""], ["b", "T2", "B2", "", "", "c", "u", ""]]
+    ws = sheet([list(r) for r in rows])
+
+    with pytest.raises(RuntimeError):
+        sheets_db.migrate_schema()
+    assert ws.rows == rows
+    assert ws.spreadsheet.metadata == []
+
+
+def test_refuses_empty_sheet(sheet):
+    ws = sheet([[]])
+    with pytest.raises(RuntimeError):
+        sheets_db.migrate_schema()
+    assert ws.spreadsheet.metadata == []
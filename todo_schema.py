@@ -0,0 +1,47 @@
+"""
+Todoの列と値の形（保存先に依らない定義。sheets_db / sqlite_db の両方が使う）
+
+外部ライブラリにも他のモジュールにも依存しないので、どのバックエンドからでも import できる。
+"""
+import re
+from datetime import date, datetime
+from functools import lru_cache
+
+# 新スキーマ（priority追加、owner=担当者のLINE通知用。空ならチーム全体）
+HEADERS = ["id", "title", "body", "due_date", "priority", "created_at", "updated_at", "owner"]
+# 編集で書き換える列（id / created_at / updated_at 以外）
+EDITABLE_FIELDS = ["title", "body", "due_date", "priority", "owner"]
+
+
+# ==========
+# 日付正規化（表記ゆれに強い）
+# ==========
+@lru_cache(maxsize=4096)
+def _parse_due_date(s: str) -> date | None:
+    s = s.strip()
+    if not s:
+        return None
+
+    # 2026/2/12 → 2026-2-12
+    s = s.replace("/", "-")
+
+    # YYYY-MM-DD（1桁月日も許容）
+    m = re.fullmatch(r"(\d{4})-(\d{1,2})-(\d{1,2})", s)
+    if m:
+        try:
+            return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        except ValueError:
+            return None
+
+    # 2026-02-12 00:00:00 や ISO形式
+    try:
+        return datetime.fromisoformat(s.replace(" ", "T")).date()
+    except ValueError:
+        return None
+
+
+def parse_due_date(s) -> date | None:
+    """Sheetsのdue_date値を date に（読めなければNone）"""
+    if s is None:
+        return None
+    return _parse_due_date(str(s))
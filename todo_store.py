@@ -0,0 +1,276 @@
+"""
+Todoの保存先（バックエンド）を切り替える窓口
+
+  TODO_BACKEND=sheets（既定） … Googleスプレッドシート（sheets_db）
+  TODO_BACKEND=sqlite          … SQLite（sqlite_db）。TODO_SQLITE_PATH（既定 todos.sqlite3）
+
+アプリ・Webhook・リマインドはここの関数だけを使う（sheets_db と同じ名前・同じ戻り値）。
+list_todos は現役のタスクだけを返す。期日の古いタスクは archive_old_todos で月別に移し、
+archived_months / list_archived で明示的に読む。
+"""
+import abc
+import os
+import threading
+
+TODO_BACKEND = os.getenv("TODO_BACKEND", "sheets")
+TODO_SQLITE_PATH = os.getenv("TODO_SQLITE_PATH", "todos.sqlite3")
+# archive_old_todos の既定: 期日がこの日数より前のタスクを月別アーカイブへ移す
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+
+
+class TodoStore(abc.ABC):
+    """
+    バックエンドの共通インターフェース（抽象メソッドを全部実装しないとインスタンスを作れない）。
+    data_version は内容が変わるたびに増える番号で、呼び出し側の派生データのメモ化キーになる。
+    """
+
+    # 読み取り
+    @abc.abstractmethod
+    def list_todos(self, columns=None) -> list[dict]:
+        ...
+
+    @abc.abstractmethod
+    def get_todo_fields(self, todo_ids, columns) -> dict:
+        ...
+
+    @abc.abstractmethod
+    def snapshot(self, columns=None) -> tuple[int, list[dict]]:
+        ...
+
+    # まとめて書き込み
+    @abc.abstractmethod
+    def add_todos(self, todos) -> list[str]:
+        ...
+
+    @abc.abstractmethod
+    def update_todos(self, updates) -> dict:
+        ...
+
+    @abc.abstractmethod
+    def delete_todos(self, todo_ids) -> dict:
+        ...
+
+    # バージョン・通知
+    @abc.abstractmethod
+    def data_version(self) -> int:
+        ...
+
+    @abc.abstractmethod
+    def check_version(self) -> int:
+        ...
+
+    @abc.abstractmethod
+    def invalidate_cache(self):
+        ...
+
+    @abc.abstractmethod
+    def add_change_listener(self, fn):
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+    # アーカイブ（期日の月ごと。月は "YYYY-MM"）
+    @abc.abstractmethod
+    def archive_old_todos(self, days) -> dict:
+        ...
+
+    # これより前の期日だけがアーカイブにありうる（archive_old_todos の一番新しい基準日。未実施ならNone）
+    @abc.abstractmethod
+    def archive_cutoff(self):
+        ...
+
+    @abc.abstractmethod
+    def archived_months(self) -> list[str]:
+        ...
+
+    @abc.abstractmethod
+    def list_archived(self, month, columns=None) -> list[dict]:
+        ...
+
+    # 1件ずつの操作はまとめて版で
+    def add_todo(self, title, body, due_date, priority, owner=""):
+        return self.add_todos([{
+            "title": title,
+            "body": body,
+            "due_date": due_date,
+            "priority": priority,
+            "owner": owner,
+        }])[0]
+
+    def update_todo(self, todo_id, new_title, new_body, new_due_date, new_priority):
+        result = self.update_todos([{
+            "id": todo_id,
+            "title": new_title,
+            "body": new_body,
+            "due_date": new_due_date,
+            "priority": new_priority,
+        }])
+        if not result[todo_id]:
+            raise ValueError("todo_id not found")
+        return True
+
+    def delete_todo(self, todo_id):
+        if not self.delete_todos([todo_id])[todo_id]:
+            raise ValueError("todo_id not found")
+        return True
+
+
+class SheetsStore(TodoStore):
+    """sheets_db（モジュール単位でキャッシュ・接続を持つ）をそのまま使う"""
+
+    def __init__(self):
+        import sheets_db
+
+        self._db = sheets_db
+
+    def list_todos(self, columns=None):
+        return self._db.list_todos(columns)
+
+    def get_todo_fields(self, todo_ids, columns):
+        return self._db.get_todo_fields(todo_ids, columns)
+
+    def snapshot(self, columns=None):
+        return self._db.snapshot(columns)
+
+    def add_todos(self, todos):
+        return self._db.add_todos(todos)
+
+    def update_todos(self, updates):
+        return self._db.update_todos(updates)
+
+    def delete_todos(self, todo_ids):
+        return self._db.delete_todos(todo_ids)
+
+    def data_version(self):
+        return self._db.data_version()
+
+    def check_version(self):
+        return self._db.check_version()
+
+    def invalidate_cache(self):
+        self._db.invalidate_cache()
+
+    def add_change_listener(self, fn):
+        self._db.add_change_listener(fn)
+
+    def stats(self):
+        return self._db.stats()
+
+    def archive_old_todos(self, days):
+        return self._db.archive_old_todos(days)
+
+    def archive_cutoff(self):
+        return self._db.archive_cutoff()
+
+    def archived_months(self):
+        return self._db.archived_months()
+
+    def list_archived(self, month, columns=None):
+        return self._db.list_archived(month, columns)
+
+
+# ==========
+# 設定で選んだバックエンド（プロセスで1つ）
+# ==========
+_lock = threading.Lock()
+_store = None
+
+
+def make_store(backend: str = None) -> TodoStore:
+    backend = (backend or TODO_BACKEND).lower()
+    if backend == "sheets":
+        return SheetsStore()
+    if backend == "sqlite":
+        from sqlite_db import SqliteStore
+
+        return SqliteStore(TODO_SQLITE_PATH)
+    raise ValueError(f"unknown TODO_BACKEND: {backend}")
+
+
+def get_store() -> TodoStore:
+    global _store
+    with _lock:
+        if _store is None:
+            _store = make_store()
+        return _store
+
+
+def set_store(store: TodoStore):
+    """バックエンドを差し替える（ベンチマークやテスト用）"""
+    global _store
+    with _lock:
+        _store = store
+
+
+def list_todos(columns=None):
+    return get_store().list_todos(columns)
+
+
+def get_todo_fields(todo_ids, columns):
+    return get_store().get_todo_fields(todo_ids, columns)
+
+
+def snapshot(columns=None):
+    return get_store().snapshot(columns)
+
+
+def add_todo(title, body, due_date, priority, owner=""):
+    return get_store().add_todo(title, body, due_date, priority, owner)
+
+
+def add_todos(todos):
+    return get_store().add_todos(todos)
+
+
+def update_todo(todo_id, new_title, new_body, new_due_date, new_priority):
+    return get_store().update_todo(todo_id, new_title, new_body, new_due_date, new_priority)
+
+
+def update_todos(updates):
+    return get_store().update_todos(updates)
+
+
+def delete_todo(todo_id):
+    return get_store().delete_todo(todo_id)
+
+
+def delete_todos(todo_ids):
+    return get_store().delete_todos(todo_ids)
+
+
+def data_version():
+    return get_store().data_version()
+
+
+def check_version():
+    return get_store().check_version()
+
+
+def invalidate_cache():
+    get_store().invalidate_cache()
+
+
+def add_change_listener(fn):
+    get_store().add_change_listener(fn)
+
+
+def archive_old_todos(days=None):
+    """期日が days（既定 ARCHIVE_AFTER_DAYS）日より前のタスクを移す。戻り値: {月: 件数}"""
+    return get_store().archive_old_todos(ARCHIVE_AFTER_DAYS if days is None else days)
+
+
+def archive_cutoff():
+    return get_store().archive_cutoff()
+
+
+def archived_months():
+    return get_store().archived_months()
+
+
+def list_archived(month, columns=None):
+    return get_store().list_archived(month, columns)
+
+
+def store_stats():
+    return dict(get_store().stats(), backend=type(get_store()).__name__)
@@ -0,0 +1,217 @@
+"""
+Streamlit一覧の表示パイプライン（pandasだけ。Streamlitに依存しない）
+
+  rows --to_df--> df --prepare--> 検索/並べ替え用の列つき --filter_sort--> view --to_display--> 表示用
+
+prepare はデータのバージョンごとに1回、filter_sort/to_display の結果は ViewMemo で
+(バージョン, 検索語, 表示, 重要度, 並び順) ごとに使い回す。
+"""
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+PRIORITY_CHOICES = ["High", "Medium", "Low"]
+# 並べ替え用（空＝未設定が一番低い）
+_PRIORITY_CAT = pd.CategoricalDtype(["", "Low", "Medium", "High"], ordered=True)
+
+BASE_COLS = ["id", "title", "body", "due_date", "priority", "created_at", "updated_at", "owner"]
+
+# 表の上で直接編集できる列
+EDITABLE_COLS = ["title", "body", "due_date", "priority", "owner"]
+
+SHOW_MODES = ["すべて", "期限ありのみ", "期限なしのみ"]
+SORT_MODES = ["更新が新しい順", "期限が近い順", "重要度が高い順", "タイトル順"]
+
+
+def to_df(rows):
+    # priority列・owner列（LINE通知の担当者）を追加した版
+    if not rows:
+        return pd.DataFrame(columns=BASE_COLS)
+
+    df = pd.DataFrame(rows)
+
+    # 欠けてても落ちないように（旧シートでも動く）
+    for c in BASE_COLS:
+        if c not in df.columns:
+            df[c] = ""
+
+    # due_dateを日付に寄せる（変換できないものはNaT）
+    df["due_date"] = pd.to_datetime(df["due_date"], errors="coerce").dt.date
+    df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce")
+    df["updated_at"] = pd.to_datetime(df["updated_at"], errors="coerce")
+
+    # priority正規化（想定外は空に）
+    df["priority"] = df["priority"].fillna("").astype(str)
+    df.loc[~df["priority"].isin(PRIORITY_CHOICES), "priority"] = ""
+
+    return df
+
+
+def normalize_query(text: str) -> str:
+    """検索語を検索列と同じ形に（全角英数→半角、小文字）"""
+    return unicodedata.normalize("NFKC", text or "").strip().lower()
+
+
+def _fmt_col(s: pd.Series) -> pd.Series:
+    """'YYYY-MM-DD HH:MM'（空は""）。dt.strftime は1行ずつで遅いので numpy でまとめて"""
+    values = pd.to_datetime(s, errors="coerce").to_numpy(dtype="datetime64[m]")
+    out = np.char.replace(np.datetime_as_string(values, unit="m"), "T", " ")
+    out[np.isnat(values)] = ""
+    return pd.Series(out, index=s.index).astype(str)
+
+
+def prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    検索・並べ替え・表示に使う列をまとめて作る（行ごとの apply はしない）。
+      _search: title + body を正規化して小文字
+      _due: due_date の datetime64（並べ替え・有無判定用）
+      _priority: 順序つきカテゴリ
+      _created / _updated / _due_str: 表示用の文字列
+    """
+    p = df.copy()
+    text = p["title"].fillna("").astype(str) + "\n" + p["body"].fillna("").astype(str)
+    p["_search"] = text.str.normalize("NFKC").str.lower()
+    p["_due"] = pd.to_datetime(p["due_date"], errors="coerce")
+    p["_priority"] = p["priority"].fillna("").astype(str).astype(_PRIORITY_CAT)
+    p["_updated_at"] = pd.to_datetime(p["updated_at"], errors="coerce")
+    p["_created"] = _fmt_col(p["created_at"])
+    p["_updated"] = _fmt_col(p["updated_at"])
+    p["_due_str"] = p["due_date"].astype("string")
+    return p
+
+
+def filter_sort(p: pd.DataFrame, q: str, show_mode: str, pr_filter: str, sort_mode: str) -> pd.DataFrame:
+    """条件をまとめて1つのマスクにし、最後に1回だけ切り出して並べる"""
+    mask = pd.Series(True, index=p.index)
+
+    # 検索（部分一致。正規表現としては解釈しない）
+    key = normalize_query(q)
+    if key:
+        mask &= p["_search"].str.contains(key, regex=False)
+
+    # 表示モード
+    if show_mode == "期限ありのみ":
+        mask &= p["_due"].notna()
+    elif show_mode == "期限なしのみ":
+        mask &= p["_due"].isna()
+
+    # priorityフィルタ
+    if pr_filter != "すべて":
+        mask &= p["priority"] == pr_filter
+
+    view = p[mask]
+
+    # 並び順（期限なしは最後へ）
+    if sort_mode == "更新が新しい順":
+        return view.sort_values("_updated_at", ascending=False)
+    if sort_mode == "期限が近い順":
+        return view.sort_values(["_due", "_updated_at"], ascending=[True, False], na_position="last")
+    if sort_mode == "重要度が高い順":
+        return view.sort_values(
+            ["_priority", "_due", "_updated_at"], ascending=[False, True, False], na_position="last"
+        )
+    return view.sort_values("title", ascending=True)
+
+
+def to_display(view: pd.DataFrame) -> pd.DataFrame:
+    """表示用（日時は文字列、作業用の列は落とす）"""
+    out = view[BASE_COLS].copy()
+    out["created_at"] = view["_created"]
+    out["updated_at"] = view["_updated"]
+    out["due_date"] = view["_due_str"]
+    return out.reset_index(drop=True)
+
+
+def page_count(n_rows: int, page_size: int) -> int:
+    return max(1, -(-n_rows // page_size))
+
+
+def page_slice(display: pd.DataFrame, page: int, page_size: int) -> pd.DataFrame:
+    """page（1始まり）の分だけ切り出す。範囲外は最後のページに寄せる"""
+    page = min(max(1, page), page_count(len(display), page_size))
+    start = (page - 1) * page_size
+    return display.iloc[start:start + page_size]
+
+
+# ==========
+# 表の直接編集（差分 → 検証 → まとめて保存）
+# ==========
+def diff_edits(source: pd.DataFrame, edited: pd.DataFrame, columns=EDITABLE_COLS) -> dict:
+    """
+    data_editor に渡した表（source）と返ってきた表（edited）を列ごとに比べる。
+    行の追加・削除はさせていないので行位置で対応づける。
+    戻り値: {id: {列: 新しい値（文字列）}}（変わったセルだけ）
+    """
+    out = {}
+    ids = source["id"].astype(str).to_numpy()
+    for c in columns:
+        before = source[c].astype("string").fillna("").to_numpy()
+        after = edited[c].astype("string").fillna("").to_numpy()
+        changed = before != after
+        for todo_id, v in zip(ids[changed], after[changed]):
+            out.setdefault(todo_id, {})[c] = str(v)
+    return out
+
+
+def validate_edit(fields: dict) -> tuple[dict, str]:
+    """
+    1行分の変更を検証して書き込む形に整える。
+    戻り値: (整えた変更, エラー文言)。エラーがなければ文言は ""
+    """
+    out = dict(fields)
+    if "title" in out:
+        out["title"] = out["title"].strip()
+        if not out["title"]:
+            return out, "タイトルは必須です"
+    if "due_date" in out:
+        raw = out["due_date"].strip()
+        if raw:
+            try:
+                out["due_date"] = datetime.strptime(raw, "%Y-%m-%d").date().isoformat()
+            except ValueError:
+                return out, f"期日はYYYY-MM-DDで入力してください（{raw}）"
+        else:
+            out["due_date"] = ""
+    if "priority" in out and out["priority"] not in PRIORITY_CHOICES + [""]:
+        return out, f"重要度は {' / '.join(PRIORITY_CHOICES)} のどれかです"
+    if "owner" in out:
+        out["owner"] = out["owner"].strip()
+    return out, ""
+
+
+class ViewMemo:
+    """
+    prepare の結果と、条件ごとの表示用DataFrameを覚えておく（セッションごとに1つ）。
+    データのバージョンが変わったら全部捨てる。
+    """
+
+    def __init__(self, maxsize: int = 8):
+        self.maxsize = maxsize
+        self._version = None
+        self._prepared = None
+        self._views = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def view(self, version, df: pd.DataFrame, q: str, show_mode: str, pr_filter: str, sort_mode: str) -> pd.DataFrame:
+        if version != self._version or self._prepared is None:
+            self._version = version
+            self._prepared = prepare(df)
+            self._views.clear()
+
+        key = (normalize_query(q), show_mode, pr_filter, sort_mode)
+        hit = self._views.get(key)
+        if hit is not None:
+            self._views.move_to_end(key)
+            self.hits += 1
+            return hit
+
+        self.misses += 1
+        out = to_display(filter_sort(self._prepared, q, show_mode, pr_filter, sort_mode))
+        self._views[key] = out
+        if len(self._views) > self.maxsize:
+            self._views.popitem(last=False)
+        return out
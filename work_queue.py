@@ -0,0 +1,106 @@
+"""
+プロセス内の作業キュー（上限付きキュー＋固定数のワーカースレッド）
+
+Webhookで「受け取ったらすぐ200を返し、処理は裏で行う」ために使う。
+"""
+import queue
+import threading
+import time
+import traceback
+
+
+class WorkQueue:
+    def __init__(self, workers: int = 4, maxsize: int = 100, name: str = "work"):
+        self._q = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "max_depth": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "run_ms_total": 0.0,
+            "run_ms_max": 0.0,
+        }
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, fn, *args) -> bool:
+        """
+        キューに積む。一杯・停止中なら False（呼び出し側で同期処理するなど）。
+        """
+        if self._closed:
+            return False
+        try:
+            self._q.put_nowait((time.monotonic(), fn, args))
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected"] += 1
+            return False
+
+        with self._lock:
+            self._stats["submitted"] += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], self._q.qsize())
+        return True
+
+    def _run(self):
+        while True:
+            item = self._q.get()
+            if item is None:
+                self._q.task_done()
+                return
+
+            enqueued, fn, args = item
+            started = time.monotonic()
+            ok = True
+            try:
+                fn(*args)
+            except Exception:
+                ok = False
+                traceback.print_exc()
+            finished = time.monotonic()
+
+            wait_ms = (started - enqueued) * 1000
+            run_ms = (finished - started) * 1000
+            with self._lock:
+                self._stats["completed" if ok else "failed"] += 1
+                self._stats["wait_ms_total"] += wait_ms
+                self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+                self._stats["run_ms_total"] += run_ms
+                self._stats["run_ms_max"] = max(self._stats["run_ms_max"], run_ms)
+            self._q.task_done()
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        done = s["completed"] + s["failed"]
+        s["depth"] = self._q.qsize()
+        s["workers"] = len(self._threads)
+        s["wait_ms_avg"] = s["wait_ms_total"] / done if done else 0.0
+        s["run_ms_avg"] = s["run_ms_total"] / done if done else 0.0
+        return s
+
+    def shutdown(self, timeout: float = 10.0):
+        """
+        新規受付を止め、積まれている分を処理し終えるまで待つ（最大timeout秒）。
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._q.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))